@@ -5,14 +5,46 @@ S reálným propojením na OSM API pro sledování changesetů s tagem #projektc
 """
 
 import os
+
+# Režim serveru: 'threading' (vývojový server Werkzeug) nebo kooperativní 'gevent' / 'eventlet'
+# pro produkci. Monkey patching musí proběhnout před importem ostatních modulů.
+ASYNC_MODE = os.environ.get('SOCKETIO_ASYNC_MODE', 'threading')
+if ASYNC_MODE == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+elif ASYNC_MODE == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+
 import json
+import socket
 import time
 import threading
+from array import array
+from collections import OrderedDict, deque
+from itertools import islice
+import heapq
+import bisect
+import unicodedata
+import math
+import functools
+import gzip
+import zlib
+import hashlib
+import mimetypes
+import cProfile
+import hmac
+import re
+import random
 import logging
-from datetime import datetime, timedelta
-from flask import Flask, jsonify, request, send_from_directory
+import sqlite3
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import date, datetime, timedelta, timezone
+from flask import Flask, Response, g, jsonify, request
 from flask_socketio import SocketIO, emit
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 import requests
 from requests.adapters import HTTPAdapter
 from requests.packages.urllib3.util.retry import Retry
@@ -25,10 +57,350 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Konfigurace aplikace
-app = Flask(__name__, static_folder='.')
+# Statické soubory obsluhuje pipeline níže, automatická statická routa Flasku je vypnutá
+app = Flask(__name__, static_folder=None)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'produkce-osm-projekt-ctvrtleti-2026-tajny-klic')
 CORS(app, resources={r"/*": {"origins": "*"}})
-socketio = SocketIO(app, cors_allowed_origins="*", logger=True, engineio_logger=True)
+# Logování jednotlivých paketů Socket.IO jen na vyžádání (SOCKETIO_LOGGING=1)
+SOCKETIO_LOGGING = os.environ.get('SOCKETIO_LOGGING', '0') == '1'
+# Při více procesech jdou broadcasty přes frontu zpráv (např. redis://localhost:6379/0)
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode=ASYNC_MODE,
+                    message_queue=os.environ.get('SOCKETIO_MESSAGE_QUEUE'),
+                    logger=SOCKETIO_LOGGING, engineio_logger=SOCKETIO_LOGGING)
+
+def run_blocking(func, *args):
+    """Spustí blokující volání (SQLite, zápis a fsync souborů) mimo event loop.
+    
+    V kooperativních režimech běží volání v nativním vlákně, aby nezablokovalo ostatní
+    spojení; funkce nesmí brát zámky sdílené s greenlety. Ve vláknovém režimu se volá přímo.
+    """
+    if ASYNC_MODE == 'gevent':
+        import gevent
+        return gevent.get_hub().threadpool.apply(func, args)
+    if ASYNC_MODE == 'eventlet':
+        from eventlet import tpool
+        return tpool.execute(func, *args)
+    return func(*args)
+
+# Metriky ve formátu Prometheus (/metrics)
+METRICS_PREFIX = 'osmcz_'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(9))  # 1 kB až 64 MB
+metrics_lock = threading.Lock()
+metrics_registry = []
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+class Metric:
+    """Základ metriky - hodnoty se drží podle n-tice hodnot štítků"""
+    kind = None
+    
+    def __init__(self, name, help_text, labels=()):
+        self.name = METRICS_PREFIX + name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.values = {}
+        metrics_registry.append(self)
+    
+    def key(self, labels):
+        return tuple(str(labels.get(label, '')) for label in self.labels)
+    
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with metrics_lock:
+            items = sorted(self.values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{format_labels(self.labels, key)} {value}")
+        return lines
+
+class Counter(Metric):
+    kind = 'counter'
+    
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with metrics_lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    """Okamžitá hodnota; s funkcí collect se hodnota spočítá až při čtení metrik"""
+    kind = 'gauge'
+    
+    def __init__(self, name, help_text, labels=(), collect=None):
+        super().__init__(name, help_text, labels)
+        self.collect = collect
+    
+    def set(self, value, **labels):
+        with metrics_lock:
+            self.values[self.key(labels)] = value
+    
+    def render(self):
+        if self.collect:
+            try:
+                collected = self.collect()
+            except Exception as e:
+                logger.warning(f"Chyba při čtení metriky {self.name}: {e}")
+                collected = {}
+            # Funkce vrací buď jedno číslo, nebo slovník {n-tice štítků: hodnota}
+            if not isinstance(collected, dict):
+                collected = {(): collected}
+            with metrics_lock:
+                self.values = {key: value for key, value in collected.items() if value is not None}
+        return super().render()
+
+class Histogram(Metric):
+    kind = 'histogram'
+    
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+    
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with metrics_lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][i] += 1
+            state['sum'] += value
+            state['count'] += 1
+    
+    def time(self, **labels):
+        """Kontextový manažer, který změří dobu běhu bloku v sekundách"""
+        return MetricTimer(self, labels)
+    
+    def timed(self, **labels):
+        """Dekorátor, který měří dobu běhu funkce"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.time(**labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+    
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with metrics_lock:
+            items = sorted((key, dict(state, counts=list(state['counts']))) for key, state in self.values.items())
+        for key, state in items:
+            for bound, count in zip(self.buckets, state['counts']):
+                lines.append(f"{self.name}_bucket{format_labels(self.labels, key, [('le', bound)])} {count}")
+            lines.append(f"{self.name}_bucket{format_labels(self.labels, key, [('le', '+Inf')])} {state['count']}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {round(state['sum'], 6)}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, key)} {state['count']}")
+        return lines
+
+class MetricTimer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+    
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+def render_metrics():
+    lines = []
+    for metric in metrics_registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+OSM_FETCH_SECONDS = Histogram('osm_fetch_seconds', 'Doba stažení jedné stránky z OSM API včetně parsování')
+OSM_PARSE_SECONDS = Histogram('osm_parse_seconds', 'Doba parsování XML odpovědi OSM API')
+OSM_FETCH_ERRORS = Counter('osm_fetch_errors_total', 'Neúspěšné dotazy na OSM API')
+STATS_COMPUTE_SECONDS = Histogram('stats_compute_seconds', 'Doba výpočtu statistik', labels=('method',))
+SAVE_DATA_SECONDS = Histogram('save_data_seconds', 'Doba zápisu snapshotu dat')
+SAVE_DATA_BYTES = Histogram('save_data_bytes', 'Velikost zapsaného snapshotu dat', buckets=SIZE_BUCKETS)
+STATS_REQUESTS = Counter('stats_requests_total', 'Dotazy na /api/stats podle stavu cache (hit, stale, miss, unavailable, archive, live)',
+                         labels=('result',))
+VOTES_TOTAL = Counter('votes_total', 'Hlasování podle výsledku (ok, duplicate, limit)', labels=('result',))
+IDEAS_TOTAL = Counter('ideas_total', 'Přidané nápady')
+CHAT_MESSAGES_TOTAL = Counter('chat_messages_total', 'Zprávy v chatu')
+
+# Profilování na vyžádání - bez nastavení se nic neregistruje ani neměří
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN')  # hlavička X-Profile-Token s touto hodnotou zapne profil požadavku
+PROFILE_REQUESTS = os.environ.get('PROFILE_REQUESTS', '0') == '1'  # profilovat každý požadavek a událost
+PROFILE_JOBS = set(filter(None, os.environ.get('PROFILE_JOBS', '').split(',')))  # profilovat každý běh úloh
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', 0))  # 0 = neměřit pomalé požadavky
+# cProfile neumí dva aktivní profily najednou, souběžné požadavky se neprofilují
+profile_lock = threading.Lock()
+
+SLOW_REQUESTS = Counter('slow_requests_total', 'Požadavky a události Socket.IO delší než SLOW_REQUEST_MS',
+                        labels=('kind', 'name'))
+
+def save_profile(profiler, kind, name):
+    """Uloží profil ve formátu pstats (.prof) do PROFILE_DIR"""
+    safe_name = re.sub(r'[^A-Za-z0-9_.-]+', '_', name).strip('_') or 'root'
+    path = os.path.join(PROFILE_DIR, f"{kind}-{safe_name}-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.prof")
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        run_blocking(profiler.dump_stats, path)
+        logger.info(f"Profil uložen: {path}")
+    except OSError as e:
+        logger.error(f"Chyba při ukládání profilu: {e}")
+
+def profile_call(kind, name, func, *args):
+    """Spustí func pod cProfile a uloží profil; běží-li jiný profil, spustí ji bez profilování.
+    
+    Vrací výsledek func a zda se profilovalo.
+    """
+    if not profile_lock.acquire(blocking=False):
+        return func(*args), False
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args), True
+    finally:
+        profile_lock.release()
+        save_profile(profiler, kind, name)
+
+def report_slow(kind, name, duration):
+    if duration * 1000 >= SLOW_REQUEST_MS:
+        SLOW_REQUESTS.inc(kind=kind, name=name)
+        logger.warning(f"Pomalý {'požadavek' if kind == 'http' else 'handler'} {name}: {duration * 1000:.0f} ms")
+
+def has_profile_token():
+    token = request.headers.get('X-Profile-Token')
+    return bool(PROFILE_TOKEN and token and hmac.compare_digest(token, PROFILE_TOKEN))
+
+def start_request_profiling():
+    g.request_started = time.perf_counter()
+    if (PROFILE_REQUESTS or has_profile_token()) and profile_lock.acquire(blocking=False):
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+def finish_request_profiling(exc):
+    started = g.pop('request_started', None)
+    profiler = g.pop('profiler', None)
+    if profiler:
+        profiler.disable()
+        profile_lock.release()
+        save_profile(profiler, 'http', request.path)
+    if SLOW_REQUEST_MS and started is not None:
+        # Štítek podle pravidla routy, ne podle cesty, aby počet řad metriky zůstal omezený
+        rule = request.url_rule.rule if request.url_rule else 'unmatched'
+        report_slow('http', rule, time.perf_counter() - started)
+
+if PROFILE_TOKEN or PROFILE_REQUESTS or SLOW_REQUEST_MS:
+    app.before_request(start_request_profiling)
+    app.teardown_request(finish_request_profiling)
+
+def instrument_event(func):
+    """Obalí handler události Socket.IO měřením a profilováním; bez nastavení vrací handler beze změny"""
+    if not (PROFILE_REQUESTS or SLOW_REQUEST_MS):
+        return func
+    
+    @functools.wraps(func)
+    def wrapper(*args):
+        started = time.perf_counter()
+        try:
+            if PROFILE_REQUESTS:
+                return profile_call('socket', func.__name__, func, *args)[0]
+            return func(*args)
+        finally:
+            if SLOW_REQUEST_MS:
+                report_slow('socket', func.__name__, time.perf_counter() - started)
+    return wrapper
+
+# Omezení četnosti - token bucket pro každého klienta (IP, user_id, spojení Socket.IO).
+# Limity 'akce=počet/sekundy', počet je zároveň největší dávka; RATE_LIMITS=off vypne omezení
+RATE_LIMITS = os.environ.get('RATE_LIMITS', 'vote=20/60,idea=5/600,chat=30/60')
+RATE_LIMIT_MAX_KEYS = int(os.environ.get('RATE_LIMIT_MAX_KEYS', 10000))  # sledovaných klientů na jednu akci
+# Počet reverzních proxy před aplikací, které připisují adresu do X-Forwarded-For (0 = žádná).
+# Adresou klienta je ta, kterou připsala první důvěryhodná proxy; položky vlevo od ní
+# posílá sám klient a může je podvrhnout
+RATE_LIMIT_TRUST_PROXY = int(os.environ.get('RATE_LIMIT_TRUST_PROXY', 0))
+if RATE_LIMIT_TRUST_PROXY:
+    # Obalí i middleware Socket.IO, takže adresu opraví i pro spojení Socket.IO
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=RATE_LIMIT_TRUST_PROXY)
+
+RATE_LIMITED = Counter('rate_limited_total', 'Požadavky odmítnuté omezením četnosti podle akce', labels=('action',))
+
+class TokenBucketLimiter:
+    """Token bucket pro každý klíč s omezenou pamětí.
+    
+    Kontrola i doplnění tokenů jsou O(1); drží se nejvýše max_keys klíčů, při překročení
+    se zapomene nejdéle nepoužitý (ten by měl stejně plný zásobník).
+    """
+    
+    def __init__(self, capacity, period, max_keys=RATE_LIMIT_MAX_KEYS):
+        self.capacity = capacity
+        self.rate = capacity / period  # tokenů za sekundu
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()   # klíč -> [tokeny, čas posledního doplnění]
+        self.lock = threading.Lock()
+    
+    def _bucket(self, key, now):
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = [float(self.capacity), now]
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        else:
+            bucket[0] = min(self.capacity, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            self.buckets.move_to_end(key)
+        return bucket
+    
+    def acquire(self, keys):
+        """Odebere token všem klíčům, pokud ho mají všechny; jinak vrátí sekundy do dalšího tokenu"""
+        now = time.monotonic()
+        with self.lock:
+            buckets = [self._bucket(key, now) for key in keys if key[1]]
+            missing = max((1 - bucket[0] for bucket in buckets), default=0)
+            if missing > 0:
+                return missing / self.rate
+            for bucket in buckets:
+                bucket[0] -= 1
+            return None
+
+def parse_rate_limits(value):
+    """'vote=20/60,idea=5/600' -> {'vote': TokenBucketLimiter(20, 60), ...}"""
+    if value.strip().lower() in ('', '0', 'off'):
+        return {}
+    limiters = {}
+    for item in value.split(','):
+        action, limit = item.strip().split('=')
+        capacity, period = limit.split('/')
+        limiters[action] = TokenBucketLimiter(int(capacity), float(period))
+    return limiters
+
+rate_limiters = parse_rate_limits(RATE_LIMITS)
+
+def client_ip():
+    """Adresa klienta aktuálního požadavku (za proxy ji doplní ProxyFix podle RATE_LIMIT_TRUST_PROXY)"""
+    return request.remote_addr
+
+def rate_limit(action, **keys):
+    """Zkontroluje limit akce pro IP klienta a další klíče (user_id, sid).
+    
+    Vrací None, nebo počet sekund, za které může klient akci zopakovat.
+    """
+    limiter = rate_limiters.get(action)
+    if limiter is None:
+        return None
+    retry_after = limiter.acquire([('ip', client_ip())] + sorted(keys.items()))
+    if retry_after is not None:
+        RATE_LIMITED.inc(action=action)
+    return retry_after
+
+def rate_limited_response(retry_after):
+    """Odpověď 429 s hlavičkou Retry-After"""
+    response = jsonify({'error': 'Příliš mnoho požadavků, zkuste to prosím za chvíli'})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(math.ceil(retry_after))
+    return response
 
 # Konfigurace session pro requests
 session = requests.Session()
@@ -321,14 +693,300 @@ provided_data = {
     }
 }
 
+# Hlasovací kniha - maximální počet hlasů na uživatele a čtvrtletí
+VOTES_PER_QUARTER = 2
+# Původní data neměla hlasy rozdělené podle čtvrtletí, všechny pocházejí z Q1 2026
+LEGACY_VOTES_QUARTER = 'Q1-2026'
+
+def normalize_idea_id(value):
+    """Převede id nápadu (řetězec nebo číslo) na kanonický int, neplatné id vrátí jako None"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def current_vote_quarter():
+    """Čtvrtletí, do kterého se počítají nové hlasy ('Q4-2026')"""
+    now = datetime.now()
+    return f"Q{(now.month - 1) // 3 + 1}-{now.year}"
+
+def migrate_user_votes(raw_votes):
+    """Převede uložené hlasy na {čtvrtletí: {user_id: set(id nápadů)}}.
+    
+    Původní formát {user_id: [id, ...]} míchal řetězce a čísla; převede se jednorázově
+    do čtvrtletí LEGACY_VOTES_QUARTER s id jako int a bez duplicit.
+    Vrací (hlasy, zda byla nutná migrace).
+    """
+    ledger = {}
+    migrated = False
+    for key, value in raw_votes.items():
+        if isinstance(value, list):
+            migrated = True
+            partitions = {key: value}
+            quarter = LEGACY_VOTES_QUARTER
+        else:
+            partitions = value
+            quarter = key
+        quarter_votes = ledger.setdefault(quarter, {})
+        for user_id, idea_ids in partitions.items():
+            ids = {normalize_idea_id(idea_id) for idea_id in idea_ids}
+            ids.discard(None)
+            quarter_votes.setdefault(user_id, set()).update(ids)
+    return ledger, migrated
+
+def serialize_user_votes():
+    """Převede hlasy do podoby pro JSON"""
+    return {
+        quarter: {user_id: sorted(ids) for user_id, ids in quarter_votes.items()}
+        for quarter, quarter_votes in user_votes.items()
+    }
+
+def rebuild_idea_index():
+    """Sestaví index id -> nápad"""
+    idea_index.clear()
+    for idea in project_ideas:
+        idea_id = normalize_idea_id(idea.get('id'))
+        if idea_id is not None:
+            idea['id'] = idea_id
+            idea_index[idea_id] = idea
+
+# Výpis nápadů - seřazená pořadí se udržují při každé změně, výpis se stránkuje kurzorem
+IDEAS_PAGE_SIZE = int(os.environ.get('IDEAS_PAGE_SIZE', 50))
+IDEAS_MAX_PAGE_SIZE = 200
+
+def idea_quarter_rank(idea):
+    """Pořadí čtvrtletí, ve kterém nápad vznikl (rok * 4 + čtvrtletí)"""
+    try:
+        created = datetime.fromisoformat(idea['created_at'])
+    except (KeyError, TypeError, ValueError):
+        # Id nápadu je čas vytvoření v milisekundách
+        created = datetime.fromtimestamp(idea['id'] / 1000)
+    return created.year * 4 + (created.month - 1) // 3
+
+class IdeaListing:
+    """Pořadí nápadů podle hlasů, data a čtvrtletí udržovaná průběžně (volat se zámkem data_lock).
+    
+    Každé pořadí je seřazený seznam klíčů končících id nápadu; klíč je tedy jednoznačný
+    a slouží i jako kurzor stránkování, který se nerozbije vložením nového nápadu ani hlasem.
+    Verze se zvýší při každé změně výpisu.
+    """
+    
+    ORDERS = {
+        'votes': lambda idea: (-idea.get('votes', 0), -idea['id']),
+        # Id nápadu je čas vytvoření v milisekundách
+        'date': lambda idea: (-idea['id'],),
+        'quarter': lambda idea: (-idea_quarter_rank(idea), -idea.get('votes', 0), -idea['id']),
+    }
+    
+    def __init__(self):
+        self.orders = {name: [] for name in self.ORDERS}
+        self.keys = {}  # id nápadu -> {pořadí: klíč}
+        self.version = 0
+        # Verze se po restartu počítá znovu, ETag proto nese i náhodnou značku procesu
+        self.epoch = os.urandom(4).hex()
+    
+    def rebuild(self, ideas):
+        self.keys = {idea['id']: {name: key(idea) for name, key in self.ORDERS.items()} for idea in ideas}
+        for name in self.ORDERS:
+            self.orders[name] = sorted(keys[name] for keys in self.keys.values())
+        self.version += 1
+    
+    def update(self, idea):
+        """Zařadí nový nápad nebo přeřadí nápad po změně hlasů"""
+        old_keys = self.keys.get(idea['id'], {})
+        new_keys = self.keys[idea['id']] = {name: key(idea) for name, key in self.ORDERS.items()}
+        for name, order in self.orders.items():
+            if old_keys.get(name) == new_keys[name]:
+                continue
+            if name in old_keys:
+                del order[bisect.bisect_left(order, old_keys[name])]
+            bisect.insort(order, new_keys[name])
+        self.version += 1
+    
+    def touch(self):
+        """Změna nápadu, která nemění pořadí (např. vítězný nápad)"""
+        self.version += 1
+    
+    def page(self, name, after=None, limit=IDEAS_PAGE_SIZE):
+        """Stránka klíčů za kurzorem after; vrací (klíče, zda následují další)"""
+        order = self.orders[name]
+        start = bisect.bisect_right(order, after) if after is not None else 0
+        keys = order[start:start + limit]
+        return keys, start + limit < len(order)
+
+idea_listing = IdeaListing()
+
+def encode_idea_cursor(key):
+    return '_'.join(str(part) for part in key)
+
+def decode_idea_cursor(cursor):
+    """Kurzor z předchozí stránky -> klíč pořadí, None pro neplatný kurzor"""
+    try:
+        return tuple(int(part) for part in cursor.split('_'))
+    except ValueError:
+        return None
+
+# Chat - kruhový buffer posledních zpráv
+CHAT_HISTORY_SIZE = 200
+CHAT_REPLAY_SIZE = 50  # počet zpráv v jedné dávce historie
+
+def create_chat_buffer(messages):
+    """Vytvoří kruhový buffer zpráv; zprávy dostanou souvislá pořadová čísla 'seq'"""
+    buffer = deque(maxlen=CHAT_HISTORY_SIZE)
+    messages = list(messages)[-CHAT_HISTORY_SIZE:]
+    
+    # Starší data pořadová čísla nemají - očíslujeme je znovu od jedné
+    first_seq = messages[0].get('seq') if messages else None
+    contiguous = isinstance(first_seq, int) and all(
+        message.get('seq') == first_seq + i for i, message in enumerate(messages)
+    )
+    for i, message in enumerate(messages, start=1):
+        if not contiguous:
+            message['seq'] = i
+        buffer.append(message)
+    return buffer
+
+def append_chat_message(message):
+    """Přidá zprávu do chatu a přidělí jí další pořadové číslo (volat se zámkem data_lock)"""
+    message['seq'] = chat_messages[-1]['seq'] + 1 if chat_messages else 1
+    if len(chat_messages) == chat_messages.maxlen:
+        # Nejstarší zpráva z bufferu vypadne, z vyhledávání také
+        search_index.remove(('chat', chat_messages[0]['seq']))
+    chat_messages.append(message)
+    index_chat_message(message)
+
+def chat_history_page(before=None, limit=CHAT_REPLAY_SIZE):
+    """Vrátí dávku zpráv starších než seq 'before' (bez before nejnovější zprávy).
+    
+    Pořadová čísla v bufferu jsou souvislá, pozici kurzoru proto spočítáme přímo.
+    """
+    limit = max(1, min(int(limit), CHAT_REPLAY_SIZE))
+    with data_lock:
+        if not chat_messages:
+            return {'messages': [], 'cursor': None, 'has_more': False}
+        first_seq = chat_messages[0]['seq']
+        end = len(chat_messages) if before is None else max(0, min(len(chat_messages), int(before) - first_seq))
+        start = max(0, end - limit)
+        messages = list(islice(chat_messages, start, end))
+    return {
+        'messages': messages,
+        'cursor': messages[0]['seq'] if messages else None,
+        'has_more': start > 0
+    }
+
+# Vyhledávání - invertovaný index nad nápady a zprávami v chatu
+SEARCH_MIN_PREFIX = 2   # kratší slova dotazu se hledají jen celá
+SEARCH_MAX_RESULTS = 50
+SEARCH_WEIGHTS = {'title': 3, 'description': 1, 'author': 1, 'text': 1, 'user': 1}
+SEARCH_TOKEN = re.compile(r'\w+')
+
+def fold_text(text):
+    """Malá písmena bez diakritiky ('Přesný' -> 'presny')"""
+    decomposed = unicodedata.normalize('NFKD', str(text).lower())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+def search_tokens(text):
+    return SEARCH_TOKEN.findall(fold_text(text))
+
+class SearchIndex:
+    """Invertovaný index slov (bez diakritiky) na dokumenty s vahou podle pole.
+    
+    Dokumenty se přidávají a odebírají po jednom; slovník slov je seřazený, takže hledání
+    podle začátku slova projde jen slova s daným prefixem, nikdy všechny dokumenty.
+    Volat se zámkem data_lock.
+    """
+    
+    def __init__(self):
+        self.postings = {}     # slovo -> {klíč dokumentu: váha}
+        self.vocabulary = []   # seřazená slova
+        self.documents = {}    # klíč dokumentu -> slova dokumentu
+    
+    def add(self, key, fields):
+        """Zaindexuje dokument; fields je {pole: text}, váhy polí viz SEARCH_WEIGHTS"""
+        self.remove(key)
+        weights = {}
+        for field, text in fields.items():
+            for token in set(search_tokens(text or '')):
+                weights[token] = weights.get(token, 0) + SEARCH_WEIGHTS[field]
+        for token, weight in weights.items():
+            postings = self.postings.get(token)
+            if postings is None:
+                postings = self.postings[token] = {}
+                bisect.insort(self.vocabulary, token)
+            postings[key] = weight
+        self.documents[key] = tuple(weights)
+    
+    def remove(self, key):
+        for token in self.documents.pop(key, ()):
+            postings = self.postings[token]
+            del postings[key]
+            if not postings:
+                del self.postings[token]
+                del self.vocabulary[bisect.bisect_left(self.vocabulary, token)]
+    
+    def clear(self):
+        self.postings.clear()
+        self.vocabulary.clear()
+        self.documents.clear()
+    
+    def _term_scores(self, term):
+        """Dokumenty odpovídající jednomu slovu dotazu - celé slovo plnou vahou, prefix poloviční"""
+        scores = dict(self.postings.get(term, {}))
+        if len(term) >= SEARCH_MIN_PREFIX:
+            position = bisect.bisect_left(self.vocabulary, term)
+            for token in islice(self.vocabulary, position, None):
+                if not token.startswith(term):
+                    break
+                if token == term:
+                    continue
+                for key, weight in self.postings[token].items():
+                    scores[key] = max(scores.get(key, 0), weight / 2)
+        return scores
+    
+    def search(self, query):
+        """Klíče dokumentů obsahujících všechna slova dotazu (i jako prefix) se skóre"""
+        terms = sorted(set(search_tokens(query)), key=len, reverse=True)
+        if not terms:
+            return {}
+        # Nejdelší slovo má obvykle nejméně výsledků, ostatní jen zužují
+        results = self._term_scores(terms[0])
+        for term in terms[1:]:
+            if not results:
+                break
+            scores = self._term_scores(term)
+            results = {key: score + scores[key] for key, score in results.items() if key in scores}
+        return results
+
+search_index = SearchIndex()
+
+def index_idea(idea):
+    search_index.add(('idea', idea['id']),
+                     {'title': idea.get('title'), 'description': idea.get('description'), 'author': idea.get('author')})
+
+def index_chat_message(message):
+    search_index.add(('chat', message['seq']), {'text': message.get('text'), 'user': message.get('user')})
+
+def rebuild_search_index():
+    """Zaindexuje znovu všechny nápady a zprávy v bufferu chatu"""
+    search_index.clear()
+    for idea in project_ideas:
+        index_idea(idea)
+    for message in chat_messages:
+        index_chat_message(message)
+
 # Inicializace globálních proměnných s poskytnutými daty
-chat_messages = provided_data['chat_messages']
+chat_messages = create_chat_buffer(provided_data['chat_messages'])
 project_ideas = provided_data['project_ideas']
-user_votes = provided_data['user_votes']
+user_votes, _ = migrate_user_votes(provided_data['user_votes'])  # {čtvrtletí: {user_id: set(id)}}
+idea_index = {}  # id nápadu -> nápad
+rebuild_idea_index()
+rebuild_search_index()
+idea_listing.rebuild(project_ideas)
 osm_stats_cache = {
     'data': None,
-    'last_updated': None,
-    'expires_at': None
+    'last_updated': None,  # čas poslední úspěšné synchronizace s OSM API
+    'expires_at': None,
+    'last_error': None     # chyba poslední neúspěšné synchronizace
 }
 
 # Aktuální projekt - vítězný nápad pro Q1 2026
@@ -347,119 +1005,1133 @@ current_project = {
 DATA_FILE = 'osm_project_data_quarterly.json'
 CONFIG_FILE = 'osm_project_config_quarterly.json'
 
-# Načtení dat ze souboru (pokud existuje)
-def load_data():
-    global chat_messages, project_ideas, user_votes
+# Žurnál změn - každá změna se připíše na konec, snapshot se přepisuje jen při kompakci
+JOURNAL_FILE = 'osm_project_data_quarterly.journal'
+JOURNAL_COMPACT_ENTRIES = int(os.environ.get('JOURNAL_COMPACT_ENTRIES', 500))
+JOURNAL_COMPACT_INTERVAL = timedelta(seconds=int(os.environ.get('JOURNAL_COMPACT_SECONDS', 600)))
+JOURNAL_FSYNC = os.environ.get('JOURNAL_FSYNC', '1') == '1'
+
+journal_state = {
+    'file': None,         # otevřený soubor žurnálu pro připisování
+    'seq': 0,             # pořadové číslo poslední změny
+    'entries': 0,         # počet záznamů v žurnálu od poslední kompakce
+    'dirty': False,       # existují změny, které nejsou ve snapshotu
+    'last_compaction': datetime.now()
+}
+# Zámek pro změny sdílených dat (nápady, hlasy, chat) a jejich ukládání
+data_lock = threading.RLock()
+
+def journal_append(op, payload):
+    """Připíše změnu do žurnálu (volat se zámkem data_lock, po provedení změny v paměti)"""
+    journal_state['seq'] += 1
+    entry = {'seq': journal_state['seq'], 'op': op, 'data': payload}
+    try:
+        if journal_state['file'] is None:
+            journal_state['file'] = open(JOURNAL_FILE, 'a', encoding='utf-8')
+        journal_state['file'].write(json.dumps(entry, ensure_ascii=False) + '\n')
+        journal_state['file'].flush()
+        if JOURNAL_FSYNC:
+            run_blocking(os.fsync, journal_state['file'].fileno())
+    except Exception as e:
+        logger.error(f"Chyba při zápisu do žurnálu: {e}")
+    journal_state['entries'] += 1
+    journal_state['dirty'] = True
+
+def apply_journal_entry(entry):
+    """Zopakuje jednu změnu ze žurnálu nad daty v paměti"""
+    op = entry['op']
+    data = entry['data']
+    
+    if op == 'vote':
+        idea_id = normalize_idea_id(data['idea_id'])
+        quarter_votes = user_votes.setdefault(data.get('quarter', LEGACY_VOTES_QUARTER), {})
+        voted = quarter_votes.setdefault(data['user_id'], set())
+        if idea_id in idea_index and idea_id not in voted:
+            idea_index[idea_id]['votes'] = idea_index[idea_id].get('votes', 0) + 1
+            voted.add(idea_id)
+            idea_listing.update(idea_index[idea_id])
+    elif op == 'idea':
+        if data['id'] not in idea_index:
+            project_ideas.append(data)
+            idea_index[data['id']] = data
+            index_idea(data)
+            idea_listing.update(data)
+    elif op == 'chat':
+        append_chat_message(data)
+    elif op == 'winner':
+        for idea in project_ideas:
+            idea['winning'] = (idea['id'] == data['idea_id'])
+        idea_listing.touch()
+    else:
+        logger.warning(f"Neznámá operace v žurnálu: {op}")
+
+def resume_journal():
+    """Naváže číslování změn na snapshot a žurnál předchozího vedoucího uzlu (volat se zámkem data_lock).
+    
+    Změny ze žurnálu už uzel má v paměti z proudu událostí, jen se nesmí opakovat jejich pořadová čísla.
+    """
+    if journal_state['file'] is not None:
+        journal_state['file'].close()
+        journal_state['file'] = None
+    
+    seq = journal_state['seq']
     try:
         with open(DATA_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            chat_messages = data.get('chat_messages', provided_data['chat_messages'])
-            project_ideas = data.get('project_ideas', provided_data['project_ideas'])
-            user_votes = data.get('user_votes', provided_data['user_votes'])
-            logger.info(f"Data načtena ze souboru: {len(chat_messages)} zpráv, {len(project_ideas)} nápadů")
+            seq = max(seq, json.load(f).get('journal_seq', 0))
+    except (FileNotFoundError, ValueError):
+        pass
+    
+    entries = 0
+    try:
+        with open(JOURNAL_FILE, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                seq = max(seq, entry['seq'])
+                entries += 1
     except FileNotFoundError:
-        logger.info("Soubor s daty neexistuje, používám výchozí data...")
-        save_data()
+        pass
+    
+    journal_state['seq'] = seq
+    journal_state['entries'] = entries
+    journal_state['dirty'] = journal_state['dirty'] or entries > 0
 
-# Uložení dat do souboru
-def save_data():
-    data = {
-        'chat_messages': chat_messages[-200:],
-        'project_ideas': project_ideas,
-        'user_votes': user_votes,
-        'last_updated': datetime.now().isoformat()
-    }
+def replay_journal(snapshot_seq):
+    """Zopakuje změny ze žurnálu, které ještě nejsou ve snapshotu"""
+    replayed = 0
     try:
-        with open(DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        logger.info("Data uložena")
-    except Exception as e:
-        logger.error(f"Chyba při ukládání dat: {e}")
+        with open(JOURNAL_FILE, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Neúplný poslední řádek po pádu uprostřed zápisu
+                    logger.warning("Přeskakuji poškozený záznam žurnálu")
+                    continue
+                journal_state['seq'] = max(journal_state['seq'], entry['seq'])
+                if entry['seq'] <= snapshot_seq:
+                    continue
+                apply_journal_entry(entry)
+                replayed += 1
+    except FileNotFoundError:
+        return
+    
+    journal_state['entries'] = replayed
+    journal_state['dirty'] = replayed > 0
+    logger.info(f"Ze žurnálu obnoveno {replayed} změn")
 
-# OSM API funkce pro získání changesetů s tagem #projektctvrtleti
-def fetch_changesets_from_osm():
-    """Získává changesety s tagem #projektctvrtleti z OSM API"""
-    try:
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=90)  # Čtvrtletí = 90 dní
+# Načtení dat ze souboru (pokud existuje)
+def load_data():
+    global chat_messages, project_ideas, user_votes
+    with data_lock:
+        snapshot_seq = 0
+        try:
+            with open(DATA_FILE, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+                chat_messages = create_chat_buffer(data.get('chat_messages', provided_data['chat_messages']))
+                project_ideas = data.get('project_ideas', provided_data['project_ideas'])
+                raw_votes = data.get('user_votes', provided_data['user_votes'])
+                user_votes, migrated = migrate_user_votes(raw_votes)
+                if migrated:
+                    logger.info("Hlasy převedeny do formátu podle čtvrtletí")
+                    snapshot_seq = 0
+                else:
+                    snapshot_seq = data.get('journal_seq', 0)
+                logger.info(f"Data načtena ze souboru: {len(chat_messages)} zpráv, {len(project_ideas)} nápadů")
+        except FileNotFoundError:
+            logger.info("Soubor s daty neexistuje, používám výchozí data...")
         
-        logger.info(f"OSM API dotaz pro čtvrtletí: od {start_date.date()} do {end_date.date()}")
+        rebuild_idea_index()
+        rebuild_search_index()
+        idea_listing.rebuild(project_ideas)
+        journal_state['seq'] = snapshot_seq
+        replay_journal(snapshot_seq)
+        if snapshot_seq == 0:
+            journal_state['dirty'] = True
         
-        url = "https://api.openstreetmap.org/api/0.6/changesets"
+        # Snapshot a žurnál jsou sdílené, zkompaktovat je smí jen vedoucí uzel
+        if is_leader() and journal_state['dirty']:
+            save_data(force=True)
         
-        # Použijeme bbox pro ČR
-        params = {
-            'bbox': '12.09,48.55,18.87,51.06',
-            'time': f"{start_date.strftime('%Y-%m-%d')},{end_date.strftime('%Y-%m-%d')}",
-        }
+        # Sdílené úložiště kontroluje hlasy napříč uzly, musí znát i ty uložené
+        state_store.seed_votes(user_votes)
+
+def write_file_atomic(path, content):
+    """Zapíše soubor (text nebo bajty) přes dočasný soubor a přejmenování, aby nikdy nezůstal rozepsaný"""
+    tmp_file = path + '.tmp'
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    with open(tmp_file, 'wb') as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, path)
+
+# Uložení dat do souboru
+def save_data(force=False):
+    """Zkompaktuje žurnál do snapshotu.
+    
+    Bez změn se nezapisuje nic; jinak se snapshot přepíše až po JOURNAL_COMPACT_ENTRIES
+    změnách nebo po JOURNAL_COMPACT_INTERVAL. Snapshot se zapisuje atomicky přes
+    dočasný soubor a přejmenování, teprve potom se žurnál vyprázdní.
+    """
+    with data_lock:
+        # Ostatní uzly by přepsaly sdílený snapshot a vyprázdnily žurnál vedoucího uzlu
+        if not is_leader():
+            return
+        if not force:
+            if not journal_state['dirty']:
+                return
+            if (journal_state['entries'] < JOURNAL_COMPACT_ENTRIES and
+                    datetime.now() - journal_state['last_compaction'] < JOURNAL_COMPACT_INTERVAL):
+                return
         
-        headers = {
-            'User-Agent': 'OSM-Projekt-Ctvrtleti/1.0 (Czech OSM Community; https://openstreetmap.cz)'
+        data = {
+            'chat_messages': list(chat_messages),
+            'project_ideas': project_ideas,
+            'user_votes': serialize_user_votes(),
+            'journal_seq': journal_state['seq'],
+            'last_updated': datetime.now().isoformat()
+        }
+        try:
+            text = json.dumps(data, ensure_ascii=False, indent=2)
+            with SAVE_DATA_SECONDS.time():
+                run_blocking(write_file_atomic, DATA_FILE, text)
+            SAVE_DATA_BYTES.observe(len(text.encode('utf-8')))
+            
+            # Snapshot obsahuje všechny změny do journal_seq, žurnál můžeme vyprázdnit
+            if journal_state['file'] is not None:
+                journal_state['file'].close()
+            journal_state['file'] = open(JOURNAL_FILE, 'w', encoding='utf-8')
+            
+            journal_state['entries'] = 0
+            journal_state['dirty'] = False
+            journal_state['last_compaction'] = datetime.now()
+            logger.info("Data uložena")
+        except Exception as e:
+            logger.error(f"Chyba při ukládání dat: {e}")
+
+# Konfigurace OSM API
+OSM_API_URL = "https://api.openstreetmap.org/api/0.6/changesets"
+OSM_BBOX = '12.09,48.55,18.87,51.06'  # bbox pro ČR
+OSM_HEADERS = {
+    'User-Agent': 'OSM-Projekt-Ctvrtleti/1.0 (Czech OSM Community; https://openstreetmap.cz)'
+}
+OSM_PAGE_LIMIT = 100  # maximum, které API vrátí na jeden dotaz
+OSM_MAX_PAGES = int(os.environ.get('OSM_MAX_PAGES', 50))  # strop stránek na jeden běh
+# Režim stahování: 'paged' (stránkování dozadu), 'tiled' (dlaždice a časové úseky paralelně)
+# nebo 'replication' (minutové diffy replikace changesetů, okno čtvrtletí se poprvé stáhne z API)
+OSM_FETCH_MODE = os.environ.get('OSM_FETCH_MODE', 'paged')
+OSM_TILE_GRID = tuple(int(x) for x in os.environ.get('OSM_TILE_GRID', '2x2').split('x'))  # sloupce x řádky
+OSM_TIME_SLICE = timedelta(days=int(os.environ.get('OSM_TIME_SLICE_DAYS', 7)))
+OSM_MIN_TIME_SLICE = timedelta(minutes=10)  # menší úseky se dělí už jen prostorově
+# Etiketa OSM API - nejvýše několik souběžných spojení a strop dotazů na jeden běh
+OSM_FETCH_WORKERS = min(int(os.environ.get('OSM_FETCH_WORKERS', 2)), 4)
+OSM_MAX_SLICE_REQUESTS = int(os.environ.get('OSM_MAX_SLICE_REQUESTS', 500))
+# Replikace changesetů - URL nebo lokální adresář se state.yaml a diffy AAA/BBB/CCC.osm.gz
+OSM_REPLICATION_URL = os.environ.get('OSM_REPLICATION_URL',
+                                     'https://planet.openstreetmap.org/replication/changesets').rstrip('/')
+OSM_REPLICATION_MAX_DIFFS = int(os.environ.get('OSM_REPLICATION_MAX_DIFFS', 300))  # strop diffů na jeden běh
+QUARTER_DAYS = 90  # Čtvrtletí = 90 dní
+HARVEST_OVERLAP = timedelta(minutes=5)  # překryv při inkrementálním stahování
+CHANGESET_DB = os.environ.get('CHANGESET_DB', 'osm_changesets.sqlite3')
+# Žebříček: 'changesets' (počet changesetů), 'changes' (changes_count uzavřených changesetů)
+# nebo 'edits' (vytvořené/upravené/smazané objekty ze stažení changesetu, vážené OSM_EDIT_WEIGHTS)
+LEADERBOARD_MODE = os.environ.get('LEADERBOARD_MODE', 'changesets')
+OSM_EDIT_WEIGHTS = {
+    action: int(weight)
+    for action, weight in (item.split('=') for item in
+                           os.environ.get('OSM_EDIT_WEIGHTS', 'create=1,modify=1,delete=1').split(','))
+}
+OSM_DETAIL_WORKERS = min(int(os.environ.get('OSM_DETAIL_WORKERS', 2)), 4)
+OSM_DETAIL_MAX_PER_RUN = int(os.environ.get('OSM_DETAIL_MAX_PER_RUN', 300))  # strop dotazů na detaily za běh
+OSM_METADATA_BATCH = 100  # počet changesetů v jednom dotazu /changesets?changesets=...
+
+# Stav stahování changesetů - high-water mark a kurzor nedokončeného stahování
+harvest_state = {
+    'high_water_mark': None,          # created_at nejnovějšího zpracovaného changesetu
+    'resume_before': None,            # kurzor nedokončeného stahování (stránkujeme dozadu)
+    'pending_high_water_mark': None,  # high-water mark, který platí po dokončení stahování
+    'replication_sequence': None,     # poslední zpracovaný diff replikace changesetů
+    'complete_since': None,           # od kdy jsou changesety v databázi stažené úplně
+    'last_error': None,               # chyba posledního stahování
+}
+HARVEST_TIMESTAMP_KEYS = ('high_water_mark', 'resume_before', 'pending_high_water_mark', 'complete_since')
+harvest_lock = threading.Lock()
+
+def parse_osm_timestamp(value):
+    """Převede časovou značku z OSM API (UTC, s 'Z') na datetime s časovou zónou"""
+    if not value:
+        return None
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
+
+def format_osm_timestamp(dt):
+    """Převede datetime na formát, který přijímá parametr 'time' v OSM API"""
+    return dt.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def quarter_for_date(dt):
+    """Vrátí označení čtvrtletí ve formátu 'Q1-2026'"""
+    return f"Q{(dt.month - 1) // 3 + 1}-{dt.year}"
+
+# Lokální úložiště changesetů (SQLite)
+db_lock = threading.RLock()
+_db = None
+
+# Rozsah changesetu (bbox) - atributy XML i sloupce v databázi
+BOUND_COLUMNS = ('min_lat', 'min_lon', 'max_lat', 'max_lon')
+
+def get_db():
+    """Vrátí sdílené spojení do databáze changesetů, při prvním volání vytvoří schéma"""
+    global _db
+    with db_lock:
+        if _db is None:
+            conn = sqlite3.connect(CHANGESET_DB, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS changesets (
+                    id INTEGER PRIMARY KEY,
+                    user TEXT,
+                    uid INTEGER,
+                    created_at TEXT NOT NULL,
+                    closed_at TEXT,
+                    quarter TEXT NOT NULL,
+                    hashtags TEXT,
+                    comment TEXT,
+                    tags TEXT,
+                    min_lat REAL,
+                    min_lon REAL,
+                    max_lat REAL,
+                    max_lon REAL
+                );
+                CREATE INDEX IF NOT EXISTS idx_changesets_user ON changesets (user);
+                CREATE INDEX IF NOT EXISTS idx_changesets_created_at ON changesets (created_at);
+                CREATE INDEX IF NOT EXISTS idx_changesets_quarter ON changesets (quarter, user);
+                CREATE TABLE IF NOT EXISTS changeset_details (
+                    id INTEGER PRIMARY KEY,
+                    changes INTEGER,
+                    created INTEGER,
+                    modified INTEGER,
+                    deleted INTEGER
+                );
+                CREATE TABLE IF NOT EXISTS harvest_meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                );
+                CREATE TABLE IF NOT EXISTS quarter_stats (
+                    quarter TEXT PRIMARY KEY,
+                    stats TEXT NOT NULL,
+                    frozen_at TEXT NOT NULL
+                );
+            """)
+            # Starší databáze nemají rozsah changesetu, doplníme sloupce
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(changesets)')}
+            for column in BOUND_COLUMNS:
+                if column not in columns:
+                    conn.execute(f'ALTER TABLE changesets ADD COLUMN {column} REAL')
+            _db = conn
+        return _db
+
+def store_changesets(changesets):
+    """Uloží changesety do databáze a vrátí seznam nových a změněných.
+    
+    Replikace i překryv stahování přinášejí znovu changesety, které už v databázi jsou;
+    dosud otevřené se přepíšou novějším stavem a vrátí se s příznakem 'updated'.
+    """
+    rows = []
+    valid = []
+    for changeset in changesets:
+        created_dt = parse_osm_timestamp(changeset.get('created_at'))
+        if not created_dt:
+            continue
+        valid.append(changeset)
+        rows.append((
+            int(changeset['id']),
+            changeset.get('user'),
+            int(changeset['uid']) if changeset.get('uid') else None,
+            format_osm_timestamp(created_dt),
+            changeset.get('closed_at'),
+            quarter_for_date(created_dt),
+            changeset.get('hashtags', ''),
+            changeset.get('comment', ''),
+            json.dumps(changeset.get('tags', {}), ensure_ascii=False),
+            *(changeset.get(column) for column in BOUND_COLUMNS),
+        ))
+    
+    with db_lock:
+        statuses = run_blocking(insert_changeset_rows, get_db(), rows)
+    stored = []
+    for changeset, status in zip(valid, statuses):
+        if status == 'updated':
+            changeset['updated'] = True
+        if status:
+            stored.append(changeset)
+    return stored
+
+# Sloupce, které se u otevřeného changesetu mohou změnit (uživatel a čas vytvoření ne)
+CHANGESET_MUTABLE_COLUMNS = ('closed_at', 'hashtags', 'comment', 'tags') + BOUND_COLUMNS
+
+# Uzavřený changeset se už nemění - přepisuje se jen dosud otevřený, a jen pokud se něco
+# změnilo; starší zachycení (překryv replikace) tak uzavřený changeset nepřepíše
+UPSERT_CHANGESET_SQL = (
+    'INSERT INTO changesets '
+    '(id, user, uid, created_at, closed_at, quarter, hashtags, comment, tags, '
+    'min_lat, min_lon, max_lat, max_lon) '
+    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) '
+    'ON CONFLICT(id) DO UPDATE SET '
+    + ', '.join(f'{column} = excluded.{column}' for column in CHANGESET_MUTABLE_COLUMNS)
+    + ' WHERE changesets.closed_at IS NULL AND ('
+    + ' OR '.join(f'changesets.{column} IS NOT excluded.{column}' for column in CHANGESET_MUTABLE_COLUMNS)
+    + ')'
+)
+
+def insert_changeset_rows(db, rows):
+    """Vloží nebo aktualizuje řádky tabulky changesets.
+    
+    Pro každý řádek vrací 'new', 'updated', nebo None, pokud se nic nezměnilo.
+    """
+    existing = set()
+    ids = [row[0] for row in rows]
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        existing.update(
+            row[0] for row in db.execute(
+                f'SELECT id FROM changesets WHERE id IN ({",".join("?" * len(chunk))})', chunk
+            )
+        )
+    
+    statuses = []
+    with db:
+        for row in rows:
+            cursor = db.execute(UPSERT_CHANGESET_SQL, row)
+            if cursor.rowcount <= 0:
+                statuses.append(None)
+            else:
+                statuses.append('updated' if row[0] in existing else 'new')
+            # Stejný changeset může být v dávce vícekrát
+            existing.add(row[0])
+    return statuses
+
+def load_stored_changesets(since=None):
+    """Načte changesety z databáze (volitelně jen vytvořené od času since)"""
+    query = 'SELECT * FROM changesets'
+    params = ()
+    if since:
+        query += ' WHERE created_at >= ?'
+        params = (format_osm_timestamp(since),)
+    query += ' ORDER BY created_at DESC'
+    
+    with db_lock:
+        rows = get_db().execute(query, params).fetchall()
+    
+    return [
+        {
+            'id': str(row['id']),
+            'user': row['user'],
+            'uid': str(row['uid']) if row['uid'] is not None else None,
+            'created_at': row['created_at'],
+            'closed_at': row['closed_at'],
+            'tags': json.loads(row['tags'] or '{}'),
+            'hashtags': row['hashtags'],
+            'comment': row['comment'],
+            **{column: row[column] for column in BOUND_COLUMNS}
         }
+        for row in rows
+    ]
+
+def load_harvest_state():
+    """Načte high-water mark a kurzor stahování z databáze"""
+    with harvest_lock, db_lock:
+        rows = get_db().execute('SELECT key, value FROM harvest_meta').fetchall()
+        meta = {row['key']: row['value'] for row in rows}
+        for key in HARVEST_TIMESTAMP_KEYS:
+            harvest_state[key] = parse_osm_timestamp(meta.get(key))
+        sequence = meta.get('replication_sequence')
+        harvest_state['replication_sequence'] = int(sequence) if sequence else None
+        total = get_db().execute('SELECT COUNT(*) FROM changesets').fetchone()[0]
         
-        response = session.get(url, params=params, headers=headers, timeout=60)
+        if harvest_state['complete_since'] is None and harvest_state['high_water_mark'] is not None:
+            # Databáze z doby před evidencí úplnosti: první stažené okno začínalo nejpozději
+            # nejstarším uloženým changesetem. Čtvrtletí začínající dřív mohla být uložena
+            # do archivu jen částečně, proto je z něj odstraníme.
+            first = get_db().execute('SELECT MIN(created_at) FROM changesets').fetchone()[0]
+            if first is not None:
+                harvest_state['complete_since'] = parse_osm_timestamp(first)
+                complete_since = harvest_state['complete_since'].astimezone().replace(tzinfo=None)
+                partial = [
+                    row['quarter'] for row in get_db().execute('SELECT quarter FROM quarter_stats')
+                    if local_day_start(quarter_bounds(row['quarter'])[0]) < complete_since
+                ]
+                with get_db():
+                    get_db().executemany('DELETE FROM quarter_stats WHERE quarter = ?', [(q,) for q in partial])
+                save_harvest_state()
+                if partial:
+                    logger.warning(f"Z archivu odstraněna neúplně stažená čtvrtletí: {', '.join(partial)}")
+    logger.info(f"Stav stahování načten: {total} changesetů, high-water mark {meta.get('high_water_mark')}")
+
+def save_harvest_state():
+    """Uloží stav stahování do databáze (volat se zámkem harvest_lock)"""
+    with db_lock:
+        db = get_db()
+        with db:
+            db.executemany(
+                'INSERT OR REPLACE INTO harvest_meta (key, value) VALUES (?, ?)',
+                [
+                    (key, format_osm_timestamp(harvest_state[key]) if harvest_state[key] else None)
+                    for key in HARVEST_TIMESTAMP_KEYS
+                ] + [('replication_sequence', str(harvest_state['replication_sequence'])
+                      if harvest_state['replication_sequence'] is not None else None)]
+            )
+
+def parse_changeset_element(changeset):
+    """Převede element <changeset> na slovník, pokud obsahuje hashtag projektu, jinak vrátí None"""
+    # Získat všechny tagy
+    tags = {}
+    for tag in changeset.findall('tag'):
+        k = tag.get('k', '')
+        v = tag.get('v', '')
+        if k and v:
+            tags[k] = v
+    
+    # Hledáme #projektctvrtleti v tagu 'hashtags'
+    hashtags = tags.get('hashtags', '')
+    comment = tags.get('comment', '')
+    
+    # Hledáme v hashtags i comment
+    search_text = f"{hashtags} {comment}".lower()
+    
+    if '#projektctvrtleti' not in search_text and '#projektčtvrtletí' not in search_text:
+        return None
+    
+    # API uvádí changes_count, replikace num_changes
+    changes_count = changeset.get('changes_count') or changeset.get('num_changes')
+    
+    return {
+        'id': changeset.get('id'),
+        'user': changeset.get('user'),
+        'uid': changeset.get('uid'),
+        'created_at': changeset.get('created_at'),
+        'closed_at': changeset.get('closed_at'),
+        'open': changeset.get('open') == 'true',
+        'changes_count': int(changes_count) if changes_count else None,
+        # Prázdný changeset rozsah nemá
+        **{column: float(changeset.get(column)) if changeset.get(column) else None for column in BOUND_COLUMNS},
+        'tags': tags,
+        'hashtags': hashtags,
+        'comment': comment
+    }
+
+def fetch_changesets_page(start_time, end_time, bbox=OSM_BBOX):
+    """Stáhne jednu stránku (max OSM_PAGE_LIMIT) changesetů v časovém okně, od nejnovějších.
+    
+    Vrací slovník s nalezenými changesety projektu, počtem všech changesetů na stránce
+    a časem vytvoření nejstaršího a nejnovějšího z nich, nebo None při chybě.
+    """
+    params = {
+        'bbox': bbox,
+        'time': f"{format_osm_timestamp(start_time)},{format_osm_timestamp(end_time)}",
+        'limit': OSM_PAGE_LIMIT,
+    }
+    
+    with OSM_FETCH_SECONDS.time():
+        try:
+            response = session.get(OSM_API_URL, params=params, headers=OSM_HEADERS, timeout=60, stream=True)
+        except requests.RequestException:
+            OSM_FETCH_ERRORS.inc()
+            raise
         
-        if response.status_code != 200:
-            logger.error(f"Chyba OSM API: {response.status_code}")
-            return []
+        try:
+            if response.status_code != 200:
+                OSM_FETCH_ERRORS.inc()
+                logger.error(f"Chyba OSM API: {response.status_code}")
+                return None
+            
+            # Odpověď čteme přímo ze streamu, urllib3 zajistí dekompresi gzip
+            response.raw.decode_content = True
+            
+            try:
+                with OSM_PARSE_SECONDS.time():
+                    return parse_changesets_stream(response.raw)
+            except ET.ParseError as e:
+                OSM_FETCH_ERRORS.inc()
+                logger.error(f"Chyba parsování XML: {e}")
+                return None
+        finally:
+            response.close()
+
+def parse_changesets_stream(stream):
+    """Průběžně parsuje XML s changesety ze streamu.
+    
+    Každý element <changeset> se zpracuje hned po načtení a poté se uvolní, takže paměť
+    nezávisí na velikosti odpovědi. Vrací changesety projektu, počet všech changesetů
+    a čas vytvoření nejstaršího a nejnovějšího z nich.
+    """
+    page = {'changesets': [], 'count': 0, 'oldest': None, 'newest': None}
+    root = None
+    
+    for event, element in ET.iterparse(stream, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = element
+            continue
         
-        # Parse XML response
-        import xml.etree.ElementTree as ET
-        changesets = []
+        if element.tag != 'changeset':
+            continue
         
         try:
-            root = ET.fromstring(response.text)
-        except ET.ParseError as e:
-            logger.error(f"Chyba parsování XML: {e}")
-            return []
+            # Kurzor stránkování počítáme ze všech changesetů, nejen z těch s hashtagem
+            created_dt = parse_osm_timestamp(element.get('created_at'))
+            page['count'] += 1
+            if created_dt:
+                if page['oldest'] is None or created_dt < page['oldest']:
+                    page['oldest'] = created_dt
+                if page['newest'] is None or created_dt > page['newest']:
+                    page['newest'] = created_dt
+            
+            changeset_data = parse_changeset_element(element)
+            if changeset_data:
+                page['changesets'].append(changeset_data)
+                
+        except Exception as e:
+            logger.warning(f"Chyba při parsování changesetu: {e}")
+        finally:
+            # Uvolnit zpracovaný element i jeho odkaz z kořene
+            element.clear()
+            root.clear()
+    
+    return page
+
+def split_bbox(bbox, columns, rows):
+    """Rozdělí bbox 'min_lon,min_lat,max_lon,max_lat' na mřížku dlaždic"""
+    min_lon, min_lat, max_lon, max_lat = (float(x) for x in bbox.split(','))
+    lon_step = (max_lon - min_lon) / columns
+    lat_step = (max_lat - min_lat) / rows
+    return [
+        f"{min_lon + c * lon_step:.5f},{min_lat + r * lat_step:.5f},"
+        f"{min_lon + (c + 1) * lon_step:.5f},{min_lat + (r + 1) * lat_step:.5f}"
+        for c in range(columns)
+        for r in range(rows)
+    ]
+
+def split_time(start_time, end_time, step):
+    """Rozdělí časové okno na úseky délky step"""
+    slices = []
+    while start_time < end_time:
+        slice_end = min(start_time + step, end_time)
+        slices.append((start_time, slice_end))
+        start_time = slice_end
+    return slices
+
+def fetch_changesets_tiled(start_time, end_time):
+    """Stáhne changesety v okně paralelně po dlaždicích a časových úsecích.
+    
+    Úsek, který narazí na limit výsledků API, se rozdělí - nejdřív časově, u krátkých
+    úseků prostorově na čtvrtiny. Výsledky se sloučí a odstraní se duplicity podle id.
+    Vrací (changesety, čas nejnovějšího changesetu, zda se stáhly všechny úseky).
+    """
+    found = {}
+    newest = None
+    complete = True
+    requests_made = 0
+    
+    tasks = [
+        (bbox, slice_start, slice_end)
+        for bbox in split_bbox(OSM_BBOX, *OSM_TILE_GRID)
+        for slice_start, slice_end in split_time(start_time, end_time, OSM_TIME_SLICE)
+    ]
+    
+    with ThreadPoolExecutor(max_workers=OSM_FETCH_WORKERS) as pool:
+        pending = {}
         
-        for changeset in root.findall('changeset'):
-            try:
-                # Získat všechny tagy
-                tags = {}
-                for tag in changeset.findall('tag'):
-                    k = tag.get('k', '')
-                    v = tag.get('v', '')
-                    if k and v:
-                        tags[k] = v
+        def submit(task):
+            nonlocal requests_made, complete
+            if requests_made >= OSM_MAX_SLICE_REQUESTS:
+                complete = False
+                return
+            requests_made += 1
+            bbox, slice_start, slice_end = task
+            pending[pool.submit(fetch_changesets_page, slice_start, slice_end, bbox)] = task
+        
+        for task in tasks:
+            submit(task)
+        
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                bbox, slice_start, slice_end = pending.pop(future)
+                try:
+                    page = future.result()
+                except requests.RequestException as e:
+                    logger.error(f"Chyba při dotazu na OSM API: {e}")
+                    page = None
                 
-                # Hledáme #projektctvrtleti v tagu 'hashtags'
-                hashtags = tags.get('hashtags', '')
-                comment = tags.get('comment', '')
+                if page is None:
+                    complete = False
+                    continue
                 
-                # Hledáme v hashtags i comment
-                search_text = f"{hashtags} {comment}".lower()
+                for changeset in page['changesets']:
+                    found[changeset['id']] = changeset
+                if page['newest'] and (newest is None or page['newest'] > newest):
+                    newest = page['newest']
                 
-                if '#projektctvrtleti' in search_text or '#projektčtvrtletí' in search_text:
-                    changeset_data = {
-                        'id': changeset.get('id'),
-                        'user': changeset.get('user'),
-                        'uid': changeset.get('uid'),
-                        'created_at': changeset.get('created_at'),
-                        'closed_at': changeset.get('closed_at'),
-                        'tags': tags,
-                        'hashtags': hashtags,
-                        'comment': comment
-                    }
-                    changesets.append(changeset_data)
-                    
-            except Exception as e:
-                logger.warning(f"Chyba při parsování changesetu: {e}")
-                continue
+                # Plná stránka - úsek mohl mít víc changesetů, než API vrátilo
+                if page['count'] >= OSM_PAGE_LIMIT:
+                    if slice_end - slice_start > OSM_MIN_TIME_SLICE:
+                        middle = slice_start + (slice_end - slice_start) / 2
+                        submit((bbox, slice_start, middle))
+                        submit((bbox, middle, slice_end))
+                    else:
+                        for tile in split_bbox(bbox, 2, 2):
+                            submit((tile, slice_start, slice_end))
+    
+    logger.info(f"Staženo {requests_made} úseků, {len(found)} changesetů s #projektctvrtleti")
+    return list(found.values()), newest, complete
+
+def harvest_changesets_tiled(start_time, end_time):
+    """Varianta harvest_changesets pro režim 'tiled' (volat se zámkem harvest_lock)"""
+    changesets, newest, complete = fetch_changesets_tiled(start_time, end_time)
+    new_changesets = store_changesets(changesets)
+    
+    if complete:
+        high_water_mark = harvest_state['high_water_mark']
+        if newest and (high_water_mark is None or newest > high_water_mark):
+            harvest_state['high_water_mark'] = newest
+        harvest_state['last_error'] = None
+    else:
+        # High-water mark neposouváme, chybějící úseky se stáhnou při dalším běhu
+        harvest_state['last_error'] = 'Chyba OSM API'
+        logger.warning("Stahování po dlaždicích nedokončeno, pokračuji při dalším běhu")
+    
+    harvest_state['resume_before'] = None
+    harvest_state['pending_high_water_mark'] = None
+    save_harvest_state()
+    return new_changesets
+
+def replication_path(sequence):
+    """Cesta k diffu replikace podle pořadového čísla (6543210 -> '006/543/210.osm.gz')"""
+    digits = f"{sequence:09d}"
+    return f"{digits[:3]}/{digits[3:6]}/{digits[6:]}.osm.gz"
+
+def open_replication_file(path):
+    """Otevře soubor replikace jako binární stream - z HTTP(S), nebo z lokálního adresáře (i file://)"""
+    if OSM_REPLICATION_URL.startswith(('http://', 'https://')):
+        response = session.get(f"{OSM_REPLICATION_URL}/{path}", headers=OSM_HEADERS, timeout=60, stream=True)
+        if response.status_code != 200:
+            response.close()
+            raise requests.HTTPError(f"Chyba replikace OSM: {response.status_code} pro {path}")
+        # Rozbalí jen Content-Encoding přenosu, samotné diffy .osm.gz zůstanou zabalené
+        response.raw.decode_content = True
+        return response.raw
+    directory = OSM_REPLICATION_URL[len('file://'):] if OSM_REPLICATION_URL.startswith('file://') else OSM_REPLICATION_URL
+    return open(os.path.join(directory, path), 'rb')
+
+def fetch_replication_state():
+    """Pořadové číslo nejnovějšího diffu replikace ze state.yaml"""
+    with open_replication_file('state.yaml') as stream:
+        match = re.search(rb'^sequence:\s*(\d+)', stream.read(), re.MULTILINE)
+    if not match:
+        raise ValueError('state.yaml replikace neobsahuje sequence')
+    return int(match.group(1))
+
+def fetch_replication_diff(sequence):
+    """Stáhne a průběžně rozbalí a parsuje jeden diff replikace (jako parse_changesets_stream)"""
+    with OSM_FETCH_SECONDS.time():
+        try:
+            with open_replication_file(replication_path(sequence)) as raw, gzip.GzipFile(fileobj=raw) as stream:
+                with OSM_PARSE_SECONDS.time():
+                    return parse_changesets_stream(stream)
+        except Exception:
+            OSM_FETCH_ERRORS.inc()
+            raise
+
+def changeset_in_bbox(changeset, bbox=OSM_BBOX):
+    """Zda rozsah changesetu zasahuje do bboxu, stejně jako filtr bbox v OSM API (prázdné changesety ne)"""
+    if any(changeset.get(column) is None for column in BOUND_COLUMNS):
+        return False
+    min_lon, min_lat, max_lon, max_lat = (float(x) for x in bbox.split(','))
+    return (changeset['min_lon'] <= max_lon and changeset['max_lon'] >= min_lon and
+            changeset['min_lat'] <= max_lat and changeset['max_lat'] >= min_lat)
+
+def harvest_changesets_replication():
+    """Varianta harvest_changesets pro režim 'replication' (volat se zámkem harvest_lock).
+    
+    Zpracuje diffy od posledního zpracovaného pořadového čísla, nejvýše
+    OSM_REPLICATION_MAX_DIFFS za běh. Diffy obsahují changesety z celého světa,
+    hashtag se filtruje při parsování a bbox ČR hned po něm.
+    """
+    try:
+        latest = fetch_replication_state()
+    except (OSError, ValueError) as e:
+        logger.error(f"Chyba při čtení stavu replikace: {e}")
+        harvest_state['last_error'] = 'Chyba replikace OSM'
+        return []
+    
+    sequence = harvest_state['replication_sequence']
+    new_changesets = []
+    applied = 0
+    harvest_state['last_error'] = None
+    
+    while sequence < latest and applied < OSM_REPLICATION_MAX_DIFFS:
+        try:
+            page = fetch_replication_diff(sequence + 1)
+        except (OSError, EOFError, zlib.error, ET.ParseError) as e:
+            logger.error(f"Chyba při zpracování diffu replikace {sequence + 1}: {e}")
+            harvest_state['last_error'] = 'Chyba replikace OSM'
+            break
+        sequence += 1
+        applied += 1
+        harvest_state['replication_sequence'] = sequence
         
-        logger.info(f"Načteno {len(changesets)} changesetů s #projektctvrtleti")
+        new_changesets.extend(store_changesets([c for c in page['changesets'] if changeset_in_bbox(c)]))
+        # High-water mark držíme i tady, aby šlo přejít zpět na stahování z API
+        high_water_mark = harvest_state['high_water_mark']
+        if page['newest'] and (high_water_mark is None or page['newest'] > high_water_mark):
+            harvest_state['high_water_mark'] = page['newest']
+    
+    save_harvest_state()
+    
+    if sequence < latest and harvest_state['last_error'] is None:
+        logger.warning(f"Replikace zaostává o {latest - sequence} diffů, pokračuji při dalším běhu")
+    logger.info(f"Zpracováno {applied} diffů replikace (do {sequence}), "
+                f"{len(new_changesets)} nových nebo změněných changesetů s #projektctvrtleti")
+    return new_changesets
+
+def harvest_changesets_paged(start_time, now):
+    """Stránkování dozadu z OSM API (volat se zámkem harvest_lock)"""
+    high_water_mark = harvest_state['high_water_mark']
+    end_time = harvest_state['resume_before'] or now
+    newest = harvest_state['pending_high_water_mark']
+    new_changesets = []
+    pages = 0
+    complete = False
+    
+    logger.info(f"OSM API dotaz pro čtvrtletí: od {start_time.isoformat()} do {end_time.isoformat()}")
+    
+    while pages < OSM_MAX_PAGES:
+        try:
+            page = fetch_changesets_page(start_time, end_time)
+        except requests.RequestException as e:
+            logger.error(f"Chyba při dotazu na OSM API: {e}")
+            page = None
+        if page is None:
+            harvest_state['last_error'] = 'Chyba OSM API'
+            break
+        harvest_state['last_error'] = None
+        pages += 1
         
-        # Debug výpis
-        for cs in changesets[:5]:
-            logger.info(f"  - ID {cs['id']}: {cs.get('user', 'Unknown')} - Hashtags: {cs.get('hashtags', 'None')}")
+        new_changesets.extend(store_changesets(page['changesets']))
         
-        return changesets
+        if page['newest'] and (newest is None or page['newest'] > newest):
+            newest = page['newest']
         
-    except Exception as e:
-        logger.error(f"Chyba při získávání changesetů z OSM: {e}", exc_info=True)
-        return []
-
-def calculate_statistics(changesets):
+        # Neúplná stránka znamená, že jsme došli na začátek okna
+        if page['count'] < OSM_PAGE_LIMIT or page['oldest'] is None or page['oldest'] <= start_time:
+            complete = True
+            break
+        
+        # Další stránka končí nejstarším changesetem této stránky; pokud by se kurzor
+        # neposunul (mnoho changesetů ve stejné sekundě), posuneme ho o sekundu
+        if page['oldest'] < end_time:
+            end_time = page['oldest']
+        else:
+            end_time = end_time - timedelta(seconds=1)
+    
+    if complete:
+        if newest and (high_water_mark is None or newest > high_water_mark):
+            harvest_state['high_water_mark'] = newest
+        harvest_state['resume_before'] = None
+        harvest_state['pending_high_water_mark'] = None
+    else:
+        harvest_state['resume_before'] = end_time
+        harvest_state['pending_high_water_mark'] = newest
+        logger.warning(f"Stahování changesetů nedokončeno po {pages} stránkách, pokračuji při dalším běhu")
+    
+    save_harvest_state()
+    
+    logger.info(f"Staženo {pages} stránek, {len(new_changesets)} nových nebo změněných changesetů s #projektctvrtleti")
+    return new_changesets
+
+def mark_harvest_complete(start_time):
+    """Po úplném stažení okna od start_time zaznamená, odkud jsou changesety úplné (volat se zámkem harvest_lock)"""
+    if harvest_state['resume_before'] is None and harvest_state['last_error'] is None:
+        harvest_state['complete_since'] = start_time
+        save_harvest_state()
+        logger.info(f"Changesety jsou úplné od {format_osm_timestamp(start_time)}")
+
+def harvest_changesets():
+    """Stáhne nové changesety z OSM API, uloží je do databáze a vrátí ty nově nalezené.
+    
+    Při prvním běhu stránkuje dozadu přes celé čtvrtletí, další běhy stahují jen changesety
+    novější než high-water mark. Nedokončené stahování (chyba API, strop stránek) pokračuje
+    při dalším běhu od uloženého kurzoru. V režimu 'replication' se po prvním úplném
+    stažení okna z API navazuje na replikaci changesetů.
+    """
+    with harvest_lock:
+        if OSM_FETCH_MODE == 'replication' and harvest_state['replication_sequence'] is not None:
+            return harvest_changesets_replication()
+        
+        now = datetime.now(timezone.utc)
+        window_start = now - timedelta(days=QUARTER_DAYS)
+        
+        high_water_mark = harvest_state['high_water_mark']
+        start_time = window_start
+        if high_water_mark:
+            start_time = max(window_start, high_water_mark - HARVEST_OVERLAP)
+        # Stahování nenavazuje na předchozí (první běh nebo dlouhý výpadek) - changesety
+        # jsou v databázi úplné až od začátku tohoto okna
+        gap = start_time == window_start
+        
+        if OSM_FETCH_MODE == 'tiled':
+            new_changesets = harvest_changesets_tiled(start_time, now)
+            if gap:
+                mark_harvest_complete(start_time)
+            return new_changesets
+        
+        if OSM_FETCH_MODE != 'replication':
+            new_changesets = harvest_changesets_paged(start_time, now)
+            if gap:
+                mark_harvest_complete(start_time)
+            return new_changesets
+        
+        # Replikace navazuje na stav zjištěný před stažením okna; diffy z doby překryvu
+        # se zpracují znovu, duplicitní changesety databáze ignoruje
+        resumed = harvest_state['resume_before'] is not None
+        try:
+            latest = fetch_replication_state()
+        except (OSError, ValueError) as e:
+            logger.error(f"Chyba při čtení stavu replikace: {e}")
+            latest = None
+        new_changesets = harvest_changesets_paged(start_time, now)
+        if gap:
+            mark_harvest_complete(start_time)
+        if (latest is not None and not resumed and harvest_state['resume_before'] is None and
+                harvest_state['last_error'] is None):
+            harvest_state['replication_sequence'] = max(0, latest - int(HARVEST_OVERLAP.total_seconds() // 60))
+            save_harvest_state()
+            logger.info(f"Okno čtvrtletí staženo, dál navazuji na replikaci od diffu {harvest_state['replication_sequence']}")
+        return new_changesets
+
+# OSM API funkce pro získání changesetů s tagem #projektctvrtleti
+def fetch_changesets_from_osm():
+    """Stáhne z OSM API nové changesety s tagem #projektctvrtleti a vrátí je.
+    
+    Všechny dříve stažené changesety jsou uložené v lokální databázi.
+    """
+    try:
+        changesets = harvest_changesets()
+        
+        # Debug výpis
+        for cs in changesets[:5]:
+            logger.info(f"  - ID {cs['id']}: {cs.get('user', 'Unknown')} - Hashtags: {cs.get('hashtags', 'None')}")
+        
+        return changesets
+        
+    except Exception as e:
+        harvest_state['last_error'] = str(e)
+        logger.error(f"Chyba při získávání changesetů z OSM: {e}", exc_info=True)
+        return []
+
+# Detaily changesetů pro žebříček podle objemu editací
+OSM_DETAIL_REQUESTS = Counter('osm_detail_requests_total', 'Dotazy na detaily changesetů (metadata, download)',
+                              labels=('kind',))
+
+def edit_weight(changes=None, created=None, modified=None, deleted=None):
+    """Objem editací changesetu podle LEADERBOARD_MODE, nebo None, pokud ještě není znám"""
+    if LEADERBOARD_MODE == 'edits':
+        if created is None:
+            return None
+        return (created * OSM_EDIT_WEIGHTS.get('create', 1) + modified * OSM_EDIT_WEIGHTS.get('modify', 1)
+                + deleted * OSM_EDIT_WEIGHTS.get('delete', 1))
+    return changes
+
+def edit_weight_sql():
+    """SQL výraz objemu editací nad tabulkou changeset_details (alias d)"""
+    if LEADERBOARD_MODE == 'edits':
+        return (f"(d.created * {OSM_EDIT_WEIGHTS.get('create', 1)} + d.modified * {OSM_EDIT_WEIGHTS.get('modify', 1)}"
+                f" + d.deleted * {OSM_EDIT_WEIGHTS.get('delete', 1)})")
+    return 'd.changes'
+
+def fetch_changeset_metadata(ids):
+    """Stáhne metadata až OSM_METADATA_BATCH changesetů jedním dotazem; vrací None při chybě"""
+    OSM_DETAIL_REQUESTS.inc(kind='metadata')
+    params = {'changesets': ','.join(str(changeset_id) for changeset_id in ids)}
+    try:
+        response = session.get(OSM_API_URL, params=params, headers=OSM_HEADERS, timeout=60, stream=True)
+    except requests.RequestException as e:
+        logger.error(f"Chyba při dotazu na metadata changesetů: {e}")
+        return None
+    try:
+        if response.status_code != 200:
+            logger.error(f"Chyba OSM API při dotazu na metadata changesetů: {response.status_code}")
+            return None
+        response.raw.decode_content = True
+        metadata = []
+        for _, element in ET.iterparse(response.raw):
+            if element.tag == 'changeset':
+                metadata.append({
+                    'id': int(element.get('id')),
+                    'open': element.get('open') == 'true',
+                    'closed_at': element.get('closed_at'),
+                    'changes': int(element.get('changes_count') or 0),
+                })
+                element.clear()
+        return metadata
+    except (ET.ParseError, ValueError, TypeError) as e:
+        logger.error(f"Chyba parsování metadat changesetů: {e}")
+        return None
+    finally:
+        response.close()
+
+def parse_osmchange_counts(stream):
+    """Spočítá vytvořené, upravené a smazané objekty v osmChange bez držení celého dokumentu"""
+    counts = {'create': 0, 'modify': 0, 'delete': 0}
+    depth = 0
+    action = None
+    for event, element in ET.iterparse(stream, events=('start', 'end')):
+        if event == 'start':
+            depth += 1
+            if depth == 2:
+                action = element
+            elif depth == 3 and action.tag in counts:
+                counts[action.tag] += 1
+            continue
+        depth -= 1
+        if depth == 2:
+            # Zpracovaný objekt uvolníme i z rodičovské akce
+            element.clear()
+            action.clear()
+    return counts
+
+def fetch_changeset_edit_counts(changeset_id):
+    """Stáhne osmChange uzavřeného changesetu a vrátí počty akcí, nebo None při chybě"""
+    OSM_DETAIL_REQUESTS.inc(kind='download')
+    url = f"{OSM_API_URL.rsplit('/', 1)[0]}/changeset/{changeset_id}/download"
+    try:
+        response = session.get(url, headers=OSM_HEADERS, timeout=60, stream=True)
+    except requests.RequestException as e:
+        logger.error(f"Chyba při stahování changesetu {changeset_id}: {e}")
+        return None
+    try:
+        # Skrytý nebo smazaný changeset už obsah mít nebude, uložíme nuly
+        if response.status_code in (404, 410):
+            return {'create': 0, 'modify': 0, 'delete': 0}
+        if response.status_code != 200:
+            logger.error(f"Chyba OSM API při stahování changesetu {changeset_id}: {response.status_code}")
+            return None
+        response.raw.decode_content = True
+        return parse_osmchange_counts(response.raw)
+    except ET.ParseError as e:
+        logger.error(f"Chyba parsování changesetu {changeset_id}: {e}")
+        return None
+    finally:
+        response.close()
+
+def load_pending_details(window_start):
+    """Changesety v okně, jejichž objem editací ještě neznáme (nejnovější první)"""
+    condition = 'd.id IS NULL OR d.created IS NULL' if LEADERBOARD_MODE == 'edits' else 'd.id IS NULL'
+    with db_lock:
+        return get_db().execute(
+            'SELECT c.id, c.user, c.created_at, d.id AS detail_id FROM changesets c '
+            'LEFT JOIN changeset_details d ON d.id = c.id '
+            f'WHERE c.created_at >= ? AND ({condition}) ORDER BY c.created_at DESC LIMIT ?',
+            (format_osm_timestamp(window_start), OSM_DETAIL_MAX_PER_RUN)
+        ).fetchall()
+
+def save_changeset_details(db, metadata_rows, count_rows, closed_rows):
+    """Uloží detaily uzavřených changesetů do trvalé cache"""
+    with db:
+        db.executemany('INSERT OR IGNORE INTO changeset_details (id, changes) VALUES (?, ?)', metadata_rows)
+        db.executemany(
+            'INSERT INTO changeset_details (id, created, modified, deleted) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT(id) DO UPDATE SET created = excluded.created, modified = excluded.modified, '
+            'deleted = excluded.deleted',
+            count_rows
+        )
+        db.executemany('UPDATE changesets SET closed_at = ? WHERE id = ? AND closed_at IS NULL', closed_rows)
+
+def update_changeset_details(changesets, window_start):
+    """Doplní objem editací ke changesetům pro žebříček (LEADERBOARD_MODE 'changes' nebo 'edits').
+    
+    Nově stažené uzavřené changesety mají changes_count přímo z výpisu. Ostatní changesety
+    v okně bez detailů (dříve otevřené, starší data, v režimu 'edits' všechny) se doptají
+    v omezeném poolu, nejvýše OSM_DETAIL_MAX_PER_RUN za běh. Uzavřený changeset se už
+    nezmění, takže jeho detaily se ukládají natrvalo a stahují se jen jednou.
+    Čerstvým changesetům s objemem z výpisu nastaví 'edits'; ostatní changesety, jejichž
+    objem se zjistil teď, vrací pro StatsAggregator.add_edits.
+    """
+    fresh_rows = []
+    for changeset in changesets:
+        if changeset.get('changes_count') is not None and not changeset.get('open'):
+            fresh_rows.append((int(changeset['id']), changeset['changes_count']))
+            changeset['edits'] = edit_weight(changes=changeset['changes_count'])
+    
+    with db_lock:
+        run_blocking(save_changeset_details, get_db(), fresh_rows, [], [])
+    
+    pending = load_pending_details(window_start)
+    if not pending:
+        return []
+    
+    metadata_rows, count_rows, closed_rows = [], [], []
+    known = {}  # id -> changes_count uzavřených changesetů
+    missing = [row['id'] for row in pending if row['detail_id'] is None]
+    batches = [missing[i:i + OSM_METADATA_BATCH] for i in range(0, len(missing), OSM_METADATA_BATCH)]
+    
+    with ThreadPoolExecutor(max_workers=OSM_DETAIL_WORKERS) as pool:
+        for metadata in pool.map(fetch_changeset_metadata, batches):
+            for item in metadata or []:
+                if item['open']:
+                    continue
+                known[item['id']] = item['changes']
+                metadata_rows.append((item['id'], item['changes']))
+                if item['closed_at']:
+                    closed_rows.append((item['closed_at'], item['id']))
+        
+        # Stažení obsahu jen u uzavřených changesetů (s uloženými nebo právě zjištěnými metadaty)
+        counts = {}
+        if LEADERBOARD_MODE == 'edits':
+            to_download = [row['id'] for row in pending if row['detail_id'] is not None or row['id'] in known]
+            for changeset_id, result in zip(to_download, pool.map(fetch_changeset_edit_counts, to_download)):
+                if result:
+                    counts[changeset_id] = result
+                    count_rows.append((changeset_id, result['create'], result['modify'], result['delete']))
+    
+    with db_lock:
+        run_blocking(save_changeset_details, get_db(), metadata_rows, count_rows, closed_rows)
+    
+    resolved = []
+    for row in pending:
+        if LEADERBOARD_MODE == 'edits':
+            result = counts.get(row['id'])
+            edits = edit_weight(created=result['create'], modified=result['modify'],
+                                deleted=result['delete']) if result else None
+        else:
+            edits = edit_weight(changes=known.get(row['id']))
+        if edits is not None:
+            resolved.append({'id': row['id'], 'user': row['user'], 'created_at': row['created_at'], 'edits': edits})
+    
+    logger.info(f"Detaily changesetů: {len(resolved)} doplněno, {len(pending) - len(resolved)} čeká")
+    return resolved
+
+def load_changeset_weights(since):
+    """Vrátí známý objem editací changesetů vytvořených od since (id -> edits)"""
+    with db_lock:
+        rows = get_db().execute(
+            f'SELECT c.id, {edit_weight_sql()} AS edits FROM changesets c '
+            'JOIN changeset_details d ON d.id = c.id WHERE c.created_at >= ?',
+            (format_osm_timestamp(since),)
+        ).fetchall()
+    return {row['id']: row['edits'] for row in rows if row['edits'] is not None}
+
+@STATS_COMPUTE_SECONDS.timed(method='list')
+def calculate_statistics(changesets):
     """Vypočítá statistiky ze changesetů"""
     if not changesets:
         return {
@@ -486,12 +2158,15 @@ def calculate_statistics(changesets):
     changesets_today = 0
     changesets_week = 0
     user_counts = {}
+    user_edits = {}
     daily_counts = {}
     
     for changeset in changesets:
         user = changeset.get('user')
         if user:
             user_counts[user] = user_counts.get(user, 0) + 1
+            if changeset.get('edits'):
+                user_edits[user] = user_edits.get(user, 0) + changeset['edits']
         
         # Parse created_at
         created_at = changeset.get('created_at')
@@ -501,7 +2176,8 @@ def calculate_statistics(changesets):
                 if created_at.endswith('Z'):
                     created_at = created_at[:-1] + '+00:00'
                 
-                created_dt = datetime.fromisoformat(created_at)
+                # Porovnáváme v místním čase serveru
+                created_dt = datetime.fromisoformat(created_at).astimezone().replace(tzinfo=None)
                 created_date = created_dt.date()
                 
                 # Today
@@ -522,10 +2198,15 @@ def calculate_statistics(changesets):
                 continue
     
     # Create leaderboard
-    leaderboard = [{'user': user, 'changesets': count} 
-                   for user, count in sorted(user_counts.items(), 
-                                           key=lambda x: x[1], 
-                                           reverse=True)[:10]]
+    if LEADERBOARD_MODE == 'changesets':
+        leaderboard = [{'user': user, 'changesets': count} 
+                       for user, count in sorted(user_counts.items(), 
+                                               key=lambda x: x[1], 
+                                               reverse=True)[:10]]
+    else:
+        # Žebříček podle objemu editací
+        leaderboard = [{'user': user, 'changesets': user_counts[user], 'edits': edits}
+                       for user, edits in sorted(user_edits.items(), key=lambda x: (-x[1], x[0]))[:10]]
     
     # Create daily stats for last 30 days
     daily_stats = []
@@ -544,49 +2225,803 @@ def calculate_statistics(changesets):
         'last_updated': datetime.now().isoformat()
     }
 
+def stats_window(since=None, until=None):
+    """První a poslední den okna statistik v místním čase.
+    
+    Okno je [since, until) v celých dnech; bez parametrů je to okno čtvrtletí končící dneškem.
+    """
+    last_day = until.date() - timedelta(days=1) if until else datetime.now().date()
+    first_day = since.date() if since else last_day - timedelta(days=QUARTER_DAYS - 1)
+    return first_day, last_day
+
+def local_day_start(day):
+    """Půlnoc dne v místním čase (s ohledem na letní čas)"""
+    return datetime.combine(day, datetime.min.time())
+
+@STATS_COMPUTE_SECONDS.timed(method='store')
+def calculate_statistics_from_store(since=None, until=None, days=30):
+    """Vypočítá statistiky za okno indexovanými dotazy nad lokální databází.
+    
+    Okno viz stats_window, bez parametrů okno čtvrtletí shodné s StatsAggregator.
+    Dnešek, týden a denní řada (days dní) se počítají k poslednímu dni okna.
+    """
+    first_day, last_day = stats_window(since, until)
+    window = (format_osm_timestamp(local_day_start(first_day)),
+              format_osm_timestamp(local_day_start(last_day + timedelta(days=1))))
+    
+    def since_day(offset):
+        # Dnešek, týden ani denní řada nesahají před začátek okna (u krátkého okna běžícího čtvrtletí)
+        return (max(window[0], format_osm_timestamp(local_day_start(last_day - timedelta(days=offset)))), window[1])
+    
+    with db_lock:
+        db = get_db()
+        total_changesets, total_contributors = db.execute(
+            'SELECT COUNT(*), COUNT(DISTINCT user) FROM changesets WHERE created_at >= ? AND created_at < ?',
+            window
+        ).fetchone()
+        changesets_today = db.execute(
+            'SELECT COUNT(*) FROM changesets WHERE created_at >= ? AND created_at < ?',
+            since_day(0)
+        ).fetchone()[0]
+        changesets_week = db.execute(
+            'SELECT COUNT(*) FROM changesets WHERE created_at >= ? AND created_at < ?',
+            since_day(6)
+        ).fetchone()[0]
+        if LEADERBOARD_MODE == 'changesets':
+            leaderboard_rows = db.execute(
+                'SELECT user, COUNT(*) AS changesets FROM changesets '
+                'WHERE created_at >= ? AND created_at < ? AND user IS NOT NULL '
+                'GROUP BY user ORDER BY changesets DESC, user LIMIT 10',
+                window
+            ).fetchall()
+        else:
+            leaderboard_rows = db.execute(
+                f'SELECT c.user, COUNT(*) AS changesets, SUM(CASE WHEN {edit_weight_sql()} > 0 '
+                f'THEN {edit_weight_sql()} END) AS edits FROM changesets c '
+                'LEFT JOIN changeset_details d ON d.id = c.id '
+                'WHERE c.created_at >= ? AND c.created_at < ? AND c.user IS NOT NULL '
+                'GROUP BY c.user HAVING edits > 0 ORDER BY edits DESC, c.user LIMIT 10',
+                window
+            ).fetchall()
+        daily_rows = db.execute(
+            "SELECT date(created_at, 'localtime') AS day, COUNT(*) FROM changesets "
+            "WHERE created_at >= ? AND created_at < ? GROUP BY day",
+            since_day(days - 1)
+        ).fetchall()
+    
+    daily_counts = {row[0]: row[1] for row in daily_rows}
+    daily_stats = [
+        daily_counts.get((last_day - timedelta(days=i)).isoformat(), 0)
+        for i in range(days - 1, -1, -1)
+    ]
+    
+    logger.info(f"Statistiky: {total_changesets} changesetů, {total_contributors} uživatelů, dnes: {changesets_today}")
+    
+    return {
+        'total_changesets': total_changesets,
+        'total_contributors': total_contributors,
+        'changesets_today': changesets_today,
+        'changesets_week': changesets_week,
+        'leaderboard': [dict(row) for row in leaderboard_rows],
+        'daily_stats': daily_stats,
+        'last_updated': datetime.now().isoformat()
+    }
+
+class StatsAggregator:
+    """Průběžně udržované statistiky za okno čtvrtletí.
+    
+    Drží počty changesetů po dnech a po uživatelích a zpracovává jen nově stažené
+    changesety. O půlnoci se okno posune odečtením nejstarších dnů, žebříček top 10
+    se aktualizuje bez řazení všech uživatelů. Okno i týden se počítají v celých dnech
+    místního času. V režimech 'changes' a 'edits' se žebříček řadí podle objemu editací,
+    který se k changesetům doplňuje, jakmile jsou známé jejich detaily.
+    """
+    
+    LEADERBOARD_SIZE = 10
+    
+    def __init__(self, window_days=QUARTER_DAYS, mode=LEADERBOARD_MODE):
+        self.window_days = window_days
+        self.weighted = mode != 'changesets'
+        self.lock = threading.Lock()
+        self.current_day = datetime.now().date()
+        self.total = 0
+        self.day_counts = {}       # den -> počet changesetů
+        self.day_user_counts = {}  # den -> {uživatel: počet changesetů}
+        self.user_counts = {}      # uživatel -> počet changesetů v okně
+        self.day_user_edits = {}   # den -> {uživatel: objem editací}
+        self.user_edits = {}       # uživatel -> objem editací v okně
+        self.leaderboard = []      # [(uživatel, skóre)] seřazené sestupně
+    
+    def _window_start(self):
+        return self.current_day - timedelta(days=self.window_days - 1)
+    
+    def _scores(self):
+        """Hodnoty, podle kterých se řadí žebříček"""
+        return self.user_edits if self.weighted else self.user_counts
+    
+    @staticmethod
+    def _subtract(totals, day_values):
+        for user, value in day_values.items():
+            remaining = totals[user] - value
+            if remaining > 0:
+                totals[user] = remaining
+            else:
+                del totals[user]
+    
+    def _roll(self):
+        """Posune okno na aktuální den a odečte dny, které z něj vypadly"""
+        today = datetime.now().date()
+        if today == self.current_day:
+            return
+        self.current_day = today
+        
+        window_start = self._window_start()
+        expired = [day for day in set(self.day_counts) | set(self.day_user_edits) if day < window_start]
+        for day in expired:
+            self.total -= self.day_counts.pop(day, 0)
+            self._subtract(self.user_counts, self.day_user_counts.pop(day, {}))
+            self._subtract(self.user_edits, self.day_user_edits.pop(day, {}))
+        
+        # Odečtením mohl kdokoliv z žebříčku klesnout, přepočítáme jen top N
+        if expired:
+            self.leaderboard = heapq.nsmallest(
+                self.LEADERBOARD_SIZE, self._scores().items(), key=lambda x: (-x[1], x[0])
+            )
+    
+    def _update_leaderboard(self, user, count):
+        """Zařadí uživatele s novým skóre do žebříčku top N"""
+        leaderboard = [entry for entry in self.leaderboard if entry[0] != user]
+        if (len(leaderboard) < len(self.leaderboard) or len(leaderboard) < self.LEADERBOARD_SIZE
+                or (-count, user) < (-leaderboard[-1][1], leaderboard[-1][0])):
+            leaderboard.append((user, count))
+            leaderboard.sort(key=lambda x: (-x[1], x[0]))
+        self.leaderboard = leaderboard[:self.LEADERBOARD_SIZE]
+    
+    def _created_date(self, changeset):
+        """Den vytvoření changesetu v místním čase, pokud spadá do okna, jinak None"""
+        try:
+            created_date = parse_osm_timestamp(changeset.get('created_at')).astimezone().date()
+        except (ValueError, TypeError, AttributeError) as e:
+            logger.warning(f"Chyba parsování data {changeset.get('created_at')}: {e}")
+            return None
+        if not self._window_start() <= created_date <= self.current_day:
+            return None
+        return created_date
+    
+    def _add_edits(self, user, created_date, edits):
+        day_users = self.day_user_edits.setdefault(created_date, {})
+        day_users[user] = day_users.get(user, 0) + edits
+        self.user_edits[user] = self.user_edits.get(user, 0) + edits
+        if self.weighted:
+            self._update_leaderboard(user, self.user_edits[user])
+    
+    def apply(self, changesets):
+        """Započítá nově stažené changesety (každý changeset se smí započítat jen jednou)"""
+        with self.lock:
+            self._roll()
+            
+            for changeset in changesets:
+                created_date = self._created_date(changeset)
+                if created_date is None:
+                    continue
+                
+                self.total += 1
+                self.day_counts[created_date] = self.day_counts.get(created_date, 0) + 1
+                
+                user = changeset.get('user')
+                if user:
+                    day_users = self.day_user_counts.setdefault(created_date, {})
+                    day_users[user] = day_users.get(user, 0) + 1
+                    self.user_counts[user] = self.user_counts.get(user, 0) + 1
+                    if not self.weighted:
+                        self._update_leaderboard(user, self.user_counts[user])
+                    if changeset.get('edits'):
+                        self._add_edits(user, created_date, changeset['edits'])
+    
+    def add_edits(self, changesets):
+        """Doplní objem editací k již započítaným changesetům (user, created_at, edits)"""
+        with self.lock:
+            self._roll()
+            for changeset in changesets:
+                created_date = self._created_date(changeset)
+                if created_date is not None and changeset.get('user') and changeset.get('edits'):
+                    self._add_edits(changeset['user'], created_date, changeset['edits'])
+    
+    def _leaderboard_entry(self, user):
+        entry = {'user': user, 'changesets': self.user_counts.get(user, 0)}
+        if self.weighted:
+            entry['edits'] = self.user_edits.get(user, 0)
+        return entry
+    
+    def snapshot(self):
+        """Vrátí statistiky ve stejném tvaru jako calculate_statistics"""
+        with self.lock:
+            self._roll()
+            today = self.current_day
+            return {
+                'total_changesets': self.total,
+                'total_contributors': len(self.user_counts),
+                'changesets_today': self.day_counts.get(today, 0),
+                'changesets_week': sum(self.day_counts.get(today - timedelta(days=i), 0) for i in range(7)),
+                'leaderboard': [self._leaderboard_entry(user) for user, _ in self.leaderboard],
+                'daily_stats': [self.day_counts.get(today - timedelta(days=i), 0) for i in range(29, -1, -1)],
+                'last_updated': datetime.now().isoformat()
+            }
+
+stats_aggregator = StatsAggregator()
+
+def stats_aggregator_window_start():
+    """Začátek okna čtvrtletí (půlnoc místního času) jako aware datetime"""
+    return datetime.now().astimezone().replace(hour=0, minute=0, second=0, microsecond=0) \
+        - timedelta(days=QUARTER_DAYS - 1)
+
+def init_stats_aggregator():
+    """Naplní nový agregátor changesety z lokální databáze (při startu a při získání vedení)"""
+    global stats_aggregator
+    stats_aggregator = StatsAggregator()
+    window_start = stats_aggregator_window_start()
+    changesets = load_stored_changesets(since=window_start)
+    if LEADERBOARD_MODE != 'changesets':
+        weights = load_changeset_weights(window_start)
+        for changeset in changesets:
+            changeset['edits'] = weights.get(int(changeset['id']))
+    stats_aggregator.apply(changesets)
+    logger.info(f"Agregátor statistik naplněn: {len(changesets)} changesetů")
+
+# Heatmapa aktivity - rozsahy changesetů ve sloupcích, binování do mřížky přes NumPy
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+HEATMAP_GRID = tuple(int(x) for x in os.environ.get('HEATMAP_GRID', '48x24').split('x'))  # sloupce x řádky
+HEATMAP_MODE = os.environ.get('HEATMAP_MODE', 'centroid')  # 'centroid' nebo 'area' (rozprostřít přes rozsah)
+
+class ChangesetColumns:
+    """Kompaktní sloupcové uložení changesetů pro heatmapu a statistiky nad NumPy.
+    
+    Čas vytvoření se parsuje jednou při vložení (unix sekundy, v NumPy datetime64[s]),
+    uživatelé se internují na celočíselné kódy (-1 = bez uživatele) a changeset bez
+    rozsahu má souřadnice NaN. S NumPy se pole čtou bez kopírování (np.frombuffer),
+    proto se do nich smí připisovat jen pod zámkem, mimo výpočet.
+    """
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = array('q')
+        self.created = array('q')     # unix čas vytvoření v sekundách
+        self.user_codes = array('i')  # index do user_names
+        self.edits = array('q')       # objem editací pro žebříček, 0 = zatím neznámý
+        self.bounds = {column: array('f') for column in BOUND_COLUMNS}
+        self.user_names = []
+        self.user_index = {}
+    
+    def __len__(self):
+        return len(self.created)
+    
+    def _user_code(self, user):
+        if not user:
+            return -1
+        code = self.user_index.get(user)
+        if code is None:
+            code = self.user_index[user] = len(self.user_names)
+            self.user_names.append(user)
+        return code
+    
+    def append(self, changesets):
+        with self.lock:
+            for changeset in changesets:
+                created_dt = parse_osm_timestamp(changeset.get('created_at'))
+                if not created_dt:
+                    continue
+                self.ids.append(int(changeset['id']))
+                self.created.append(int(created_dt.timestamp()))
+                self.user_codes.append(self._user_code(changeset.get('user')))
+                self.edits.append(changeset.get('edits') or 0)
+                for column, values in self.bounds.items():
+                    value = changeset.get(column)
+                    values.append(math.nan if value is None else value)
+    
+    def _rows(self, ids):
+        """Indexy řádků s danými id changesetů (volat se zámkem)"""
+        if np is not None:
+            return np.flatnonzero(np.isin(np.frombuffer(self.ids, dtype=np.int64), list(ids))).tolist()
+        return [row for row, changeset_id in enumerate(self.ids) if changeset_id in ids]
+    
+    def set_edits(self, changesets):
+        """Doplní objem editací k již uloženým changesetům (id, edits)"""
+        edits = {int(changeset['id']): changeset['edits'] for changeset in changesets}
+        with self.lock:
+            for row in self._rows(edits):
+                self.edits[row] = edits[self.ids[row]]
+    
+    def set_bounds(self, changesets):
+        """Přepíše rozsah již uložených changesetů (otevřenému changesetu se rozsah zvětšuje)"""
+        updated = {int(changeset['id']): changeset for changeset in changesets}
+        with self.lock:
+            for row in self._rows(updated):
+                changeset = updated[self.ids[row]]
+                for column, values in self.bounds.items():
+                    value = changeset.get(column)
+                    values[row] = math.nan if value is None else value
+    
+    def heatmap(self, since):
+        """Spočítá mřížku aktivity nad OSM_BBOX z changesetů vytvořených od unix času since"""
+        west, south, east, north = (float(x) for x in OSM_BBOX.split(','))
+        columns, rows = HEATMAP_GRID
+        with self.lock:
+            binning = bin_heatmap_numpy if np is not None else bin_heatmap_python
+            grid = binning(self.created, self.bounds, since, (west, south, east, north), columns, rows)
+        
+        # Řádky od severu, jak se mřížka kreslí
+        cells = [[round(value, 3) for value in row] for row in reversed(grid)]
+        return {
+            'bbox': [west, south, east, north],
+            'columns': columns,
+            'rows': rows,
+            'mode': HEATMAP_MODE,
+            'cells': cells,
+            'max': max((max(row) for row in cells), default=0),
+            'total': round(sum(sum(row) for row in cells), 3),
+            'since': datetime.fromtimestamp(since).isoformat(),
+            'last_updated': datetime.now().isoformat()
+        }
+
+def bin_heatmap_numpy(created, bounds, since, bbox, columns, rows):
+    """Vektorové binování - středy (histogram2d) nebo rozsahy rozprostřené přes buňky (rozdílové pole)"""
+    west, south, east, north = bbox
+    created = np.frombuffer(created, dtype=np.int64)
+    # Počítáme ve float64 jako varianta bez NumPy, aby hrany buněk vycházely stejně
+    min_lat, min_lon, max_lat, max_lon = (np.frombuffer(bounds[column], dtype=np.float32).astype(np.float64)
+                                          for column in BOUND_COLUMNS)
+    mask = (created >= since) & np.isfinite(min_lat)
+    
+    if HEATMAP_MODE != 'area':
+        lat = (min_lat[mask] + max_lat[mask]) / 2
+        lon = (min_lon[mask] + max_lon[mask]) / 2
+        grid, _, _ = np.histogram2d(lat, lon, bins=(rows, columns), range=((south, north), (west, east)))
+        return grid.tolist()
+    
+    # Jen changesety, které mřížku aspoň částečně překrývají
+    mask &= (max_lat >= south) & (min_lat <= north) & (max_lon >= west) & (min_lon <= east)
+    lat_step = (north - south) / rows
+    lon_step = (east - west) / columns
+    r0 = np.clip(((min_lat[mask] - south) / lat_step).astype(np.int64), 0, rows - 1)
+    r1 = np.clip(((max_lat[mask] - south) / lat_step).astype(np.int64), 0, rows - 1)
+    c0 = np.clip(((min_lon[mask] - west) / lon_step).astype(np.int64), 0, columns - 1)
+    c1 = np.clip(((max_lon[mask] - west) / lon_step).astype(np.int64), 0, columns - 1)
+    weight = 1.0 / ((r1 - r0 + 1) * (c1 - c0 + 1))
+    
+    # Každý changeset přičte váhu do obdélníku buněk přes rohy rozdílového pole a kumulativní součty
+    diff = np.zeros((rows + 1, columns + 1))
+    np.add.at(diff, (r0, c0), weight)
+    np.add.at(diff, (r0, c1 + 1), -weight)
+    np.add.at(diff, (r1 + 1, c0), -weight)
+    np.add.at(diff, (r1 + 1, c1 + 1), weight)
+    return diff.cumsum(axis=0).cumsum(axis=1)[:rows, :columns].tolist()
+
+def bin_heatmap_python(created, bounds, since, bbox, columns, rows):
+    """Stejné binování bez NumPy (pomalejší, běží jen po stažení nových changesetů)"""
+    west, south, east, north = bbox
+    lat_step = (north - south) / rows
+    lon_step = (east - west) / columns
+    grid = [[0.0] * columns for _ in range(rows)]
+    
+    def cell(value, origin, step, count):
+        return min(max(int((value - origin) / step), 0), count - 1)
+    
+    for i, created_ts in enumerate(created):
+        min_lat, min_lon, max_lat, max_lon = (bounds[column][i] for column in BOUND_COLUMNS)
+        if created_ts < since or math.isnan(min_lat):
+            continue
+        if HEATMAP_MODE != 'area':
+            lat = (min_lat + max_lat) / 2
+            lon = (min_lon + max_lon) / 2
+            if south <= lat <= north and west <= lon <= east:
+                grid[cell(lat, south, lat_step, rows)][cell(lon, west, lon_step, columns)] += 1
+            continue
+        if max_lat < south or min_lat > north or max_lon < west or min_lon > east:
+            continue
+        r0, r1 = cell(min_lat, south, lat_step, rows), cell(max_lat, south, lat_step, rows)
+        c0, c1 = cell(min_lon, west, lon_step, columns), cell(max_lon, west, lon_step, columns)
+        weight = 1.0 / ((r1 - r0 + 1) * (c1 - c0 + 1))
+        for r in range(r0, r1 + 1):
+            for c in range(c0, c1 + 1):
+                grid[r][c] += weight
+    return grid
+
+# Statistiky nad sloupci - alternativní engine pro velké historie (STATS_ENGINE=numpy)
+STATS_ENGINE = os.environ.get('STATS_ENGINE', 'aggregator')
+if STATS_ENGINE == 'numpy' and np is None:
+    logger.warning("STATS_ENGINE=numpy vyžaduje balíček numpy, používám agregátor")
+    STATS_ENGINE = 'aggregator'
+
+def local_midnight(day):
+    """Unix čas půlnoci dne v místním čase"""
+    return int(local_day_start(day).timestamp())
+
+def top_scores(scores, names, size):
+    """Top N uživatelů s kladným skóre, seřazených podle (-skóre, jméno) jako StatsAggregator"""
+    candidates = np.flatnonzero(scores > 0)
+    if len(candidates) > size:
+        # Všichni se skóre aspoň N-tého nejlepšího - shody na hranici se rozhodnou podle jména
+        threshold = np.partition(scores[candidates], -size)[-size]
+        candidates = candidates[scores[candidates] >= threshold]
+    values = scores[candidates].tolist()
+    ranked = sorted(zip(candidates.tolist(), values), key=lambda x: (-x[1], names[x[0]]))
+    return ranked[:size]
+
+@STATS_COMPUTE_SECONDS.timed(method='numpy')
+def calculate_statistics_columnar(since=None, until=None, days=30):
+    """Vypočítá statistiky vektorově nad sloupci changesetů, ve stejném tvaru jako calculate_statistics.
+    
+    Okno viz stats_window, bez parametrů okno čtvrtletí shodné s StatsAggregator.
+    Dnešek, týden a denní histogram (days dní) se počítají k poslednímu dni okna.
+    """
+    first_day, last_day = stats_window(since, until)
+    window = np.array([local_midnight(first_day), local_midnight(last_day + timedelta(days=1))],
+                      dtype='datetime64[s]')
+    # Hranice dnů pro denní histogram (poslední hranice = půlnoc po posledním dni)
+    day_edges = np.array([local_midnight(last_day - timedelta(days=i)) for i in range(days - 1, -2, -1)],
+                         dtype='datetime64[s]')
+    
+    with changeset_columns.lock:
+        names = list(changeset_columns.user_names)
+        created = np.frombuffer(changeset_columns.created, dtype=np.int64).view('datetime64[s]')
+        codes = np.frombuffer(changeset_columns.user_codes, dtype=np.int32)
+        in_window = (created >= window[0]) & (created < window[1])
+        window_created = created[in_window]
+        window_codes = codes[in_window]
+        window_edits = np.frombuffer(changeset_columns.edits, dtype=np.int64)[in_window]
+        del created, codes
+    
+    day_index = np.searchsorted(day_edges, window_created, side='right') - 1
+    daily = np.bincount(day_index[(day_index >= 0) & (day_index < days)], minlength=days)
+    
+    with_user = window_codes >= 0
+    counts = np.bincount(window_codes[with_user], minlength=len(names))
+    if LEADERBOARD_MODE == 'changesets':
+        leaderboard = [{'user': names[code], 'changesets': int(count)}
+                       for code, count in top_scores(counts, names, StatsAggregator.LEADERBOARD_SIZE)]
+    else:
+        edits = np.bincount(window_codes[with_user], weights=window_edits[with_user], minlength=len(names))
+        leaderboard = [{'user': names[code], 'changesets': int(counts[code]), 'edits': int(score)}
+                       for code, score in top_scores(edits, names, StatsAggregator.LEADERBOARD_SIZE)]
+    
+    stats = {
+        'total_changesets': int(in_window.sum()),
+        'total_contributors': int(np.count_nonzero(counts)),
+        'changesets_today': int(daily[-1]),
+        'changesets_week': int(daily[-7:].sum()),
+        'leaderboard': leaderboard,
+        'daily_stats': daily.tolist(),
+        'last_updated': datetime.now().isoformat()
+    }
+    logger.info(f"Statistiky: {stats['total_changesets']} changesetů, {stats['total_contributors']} uživatelů, "
+                f"dnes: {stats['changesets_today']}")
+    return stats
+
+def current_statistics():
+    """Statistiky za okno čtvrtletí z nastaveného enginu"""
+    if STATS_ENGINE == 'numpy':
+        return calculate_statistics_columnar()
+    return stats_aggregator.snapshot()
+
+changeset_columns = ChangesetColumns()
+heatmap_cache = {'data': None, 'window_start': None}
+
+def init_changeset_columns():
+    """Načte všechny uložené changesety do nových sloupců (při startu a při získání vedení)"""
+    global changeset_columns
+    edits = edit_weight_sql() if LEADERBOARD_MODE != 'changesets' else 'NULL'
+    with db_lock:
+        rows = get_db().execute(
+            f'SELECT c.id, c.user, c.created_at, c.min_lat, c.min_lon, c.max_lat, c.max_lon, {edits} AS edits '
+            'FROM changesets c LEFT JOIN changeset_details d ON d.id = c.id'
+        ).fetchall()
+    columns = ChangesetColumns()
+    columns.append(dict(row) for row in rows)
+    changeset_columns = columns
+    logger.info(f"Sloupce changesetů naplněny: {len(changeset_columns)} changesetů")
+
+def refresh_heatmap():
+    """Přepočítá heatmapu za okno čtvrtletí a zveřejní ji ostatním uzlům (jen na vedoucím uzlu).
+    
+    Ostatní uzly mají sloupce changesetů jen ze startu, heatmapu proto přebírají od vedoucího.
+    """
+    window_start = stats_aggregator_window_start()
+    heatmap = changeset_columns.heatmap(window_start.timestamp())
+    # Otisk mřížky - klienti si podle něj ve stats_update poznají, že mají mapu načíst znovu
+    heatmap['version'] = hashlib.sha1(json.dumps(heatmap, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+    heatmap_cache['data'] = heatmap
+    heatmap_cache['window_start'] = window_start
+    publish_shared('heatmap', heatmap_cache['data'])
+    return heatmap_cache['data']
+
+# Konfigurace cache statistik
+STATS_TTL = timedelta(minutes=5)
+STATS_RETRY_INTERVAL = timedelta(seconds=int(os.environ.get('STATS_RETRY_SECONDS', 60)))
+# Při výpadku OSM API servírovat poslední dobrá data (STATS_MAX_STALE_SECONDS=0 znamená bez omezení stáří)
+STATS_SERVE_STALE = os.environ.get('STATS_SERVE_STALE', '1') == '1'
+STATS_MAX_STALE = int(os.environ.get('STATS_MAX_STALE_SECONDS', 0))
+
+# Zámek zajišťuje, že běží nejvýše jedna aktualizace statistik
+stats_refresh_lock = threading.Lock()
+
+def refresh_stats_cache(stats, synced=True):
+    """Uloží statistiky do cache; nepovedená synchronizace se zkusí znovu dříve"""
+    now = datetime.now()
+    osm_stats_cache['data'] = stats
+    if synced:
+        osm_stats_cache['last_updated'] = now
+        osm_stats_cache['expires_at'] = now + STATS_TTL
+    else:
+        osm_stats_cache['expires_at'] = now + STATS_RETRY_INTERVAL
+
 def update_osm_stats():
     """Aktualizace statistik z OSM API"""
     try:
-        changesets = fetch_changesets_from_osm()
-        stats = calculate_statistics(changesets)
+        stored = fetch_changesets_from_osm()
+        # Změněné changesety už jsou započítané, doplní se jen jejich objem editací a rozsah
+        changesets = [changeset for changeset in stored if not changeset.get('updated')]
+        updated = [changeset for changeset in stored if changeset.get('updated')]
+        resolved = []
+        if LEADERBOARD_MODE != 'changesets':
+            resolved = update_changeset_details(stored, stats_aggregator_window_start())
+            resolved += [changeset for changeset in updated if changeset.get('edits')]
+        with STATS_COMPUTE_SECONDS.time(method='aggregator'):
+            stats_aggregator.apply(changesets)
+            stats_aggregator.add_edits(resolved)
+        changeset_columns.append(changesets)
+        if updated:
+            changeset_columns.set_bounds(updated)
+        if resolved:
+            changeset_columns.set_edits(resolved)
+        stats = current_statistics()
         
-        osm_stats_cache['data'] = stats
-        osm_stats_cache['last_updated'] = datetime.now()
-        osm_stats_cache['expires_at'] = datetime.now() + timedelta(minutes=5)
+        # Heatmapa se přepočítá jen při nových nebo změněných changesetech nebo posunu okna o den
+        if stored or heatmap_cache['window_start'] != stats_aggregator_window_start():
+            refresh_heatmap()
+        stats['heatmap_version'] = heatmap_cache['data']['version']
+        
+        osm_stats_cache['last_error'] = harvest_state['last_error']
+        refresh_stats_cache(stats, synced=harvest_state['last_error'] is None)
+        refresh_live_quarter()
         
         logger.info(f"Statistiky aktualizovány: {stats['total_changesets']} changesetů, {stats['total_contributors']} uživatelů")
         
         # Broadcast update via WebSocket
         socketio.emit('stats_update', stats)
+        if STATE_BACKEND != 'local':
+            state_store.publish(NODE_ID, 'stats', stats)
         
         return stats
     except Exception as e:
+        osm_stats_cache['last_error'] = str(e)
+        osm_stats_cache['expires_at'] = datetime.now() + STATS_RETRY_INTERVAL
         logger.error(f"Chyba při aktualizaci statistik: {e}")
         return None
 
-# Periodické úlohy
-def periodic_tasks():
-    """Spouští periodické úlohy v pozadí"""
-    while True:
+def refresh_osm_stats():
+    """Spustí update_osm_stats, pokud už neběží jiná aktualizace; vrací False, pokud běží"""
+    if not stats_refresh_lock.acquire(blocking=False):
+        return False
+    try:
+        update_osm_stats()
+    finally:
+        stats_refresh_lock.release()
+    return True
+
+def trigger_stats_refresh():
+    """Naplánuje aktualizaci statistik na pozadí, pokud už žádná neprobíhá"""
+    # Ostatní uzly dostávají statistiky od vedoucího uzlu
+    if stats_refresh_lock.locked() or not is_leader():
+        return
+    socketio.start_background_task(refresh_osm_stats)
+
+# Archiv čtvrtletí - statistiky skončeného čtvrtletí se spočítají jednou z lokální databáze
+# a dál se servírují uložené, bez dotazů na OSM API a bez přepočtu
+QUARTER_PATTERN = re.compile(r'^Q([1-4])-(\d{4})$')
+# Changesety z posledního dne čtvrtletí se mohou zavírat ještě 24 hodin
+QUARTER_FREEZE_DELAY = timedelta(days=1)
+
+quarter_archive = {}  # čtvrtletí -> uložené statistiky (hotový JSON text)
+live_quarter_cache = {'quarter': None, 'version': None, 'data': None}
+
+def quarter_bounds(quarter):
+    """První den čtvrtletí a první den následujícího; None pro neplatné označení"""
+    match = QUARTER_PATTERN.match(quarter or '')
+    if not match:
+        return None
+    number, year = int(match.group(1)), int(match.group(2))
+    start = date(year, 3 * number - 2, 1)
+    end = date(year + 1, 1, 1) if number == 4 else date(year, 3 * number + 1, 1)
+    return start, end
+
+def next_quarter(quarter):
+    """Následující čtvrtletí ('Q4-2026' -> 'Q1-2027')"""
+    return quarter_for_date(quarter_bounds(quarter)[1])
+
+def calculate_quarter_statistics(quarter):
+    """Statistiky čtvrtletí od jeho prvního dne do konce (u běžícího čtvrtletí do dneška).
+    
+    Kromě běžných statistik obsahuje denní řadu za celé čtvrtletí ('daily_series'),
+    'daily_stats' je jako jinde posledních 30 dní.
+    """
+    start, end = quarter_bounds(quarter)
+    last_day = min(end - timedelta(days=1), datetime.now().date())
+    days = (last_day - start).days + 1
+    since = local_day_start(start)
+    until = local_day_start(last_day + timedelta(days=1))
+    if np is not None:
+        stats = calculate_statistics_columnar(since, until, days=days)
+    else:
+        stats = calculate_statistics_from_store(since, until, days=days)
+    stats['daily_series'] = stats['daily_stats']
+    stats['daily_stats'] = stats['daily_series'][-30:]
+    stats['quarter'] = quarter
+    stats['period'] = {'start': start.isoformat(), 'end': last_day.isoformat()}
+    return stats
+
+def load_quarter_archive():
+    """Načte uložené statistiky skončených čtvrtletí (jednou při startu)"""
+    with db_lock:
+        rows = get_db().execute('SELECT quarter, stats FROM quarter_stats').fetchall()
+    quarter_archive.update((row['quarter'], row['stats']) for row in rows)
+    if quarter_archive:
+        logger.info(f"Archiv čtvrtletí: {', '.join(sorted(quarter_archive, key=quarter_bounds))}")
+
+def store_quarter_stats(quarter, text):
+    """Uloží statistiky čtvrtletí do archivu (databáze i paměti)"""
+    with db_lock:
+        db = get_db()
+        db.execute('INSERT OR REPLACE INTO quarter_stats (quarter, stats, frozen_at) VALUES (?, ?, ?)',
+                   (quarter, text, datetime.now().isoformat()))
+        db.commit()
+    quarter_archive[quarter] = text
+
+def freeze_finished_quarters():
+    """Uloží statistiky každého skončeného čtvrtletí, které ještě není v archivu.
+    
+    Ukládají se jen čtvrtletí, která začínají po harvest_state['complete_since'] - starší
+    jsou v databázi jen částečně (první stažené okno nezačínalo na začátku čtvrtletí).
+    """
+    complete_since = harvest_state['complete_since']
+    if complete_since is None:
+        return
+    complete_since = complete_since.astimezone()
+    
+    now = datetime.now()
+    current = current_vote_quarter()
+    quarter = quarter_for_date(complete_since)
+    if local_day_start(quarter_bounds(quarter)[0]) < complete_since.replace(tzinfo=None):
+        quarter = next_quarter(quarter)
+    while quarter != current:
+        end = quarter_bounds(quarter)[1]
+        if now < local_day_start(end) + QUARTER_FREEZE_DELAY:
+            break
+        if quarter not in quarter_archive:
+            text = json.dumps(calculate_quarter_statistics(quarter), ensure_ascii=False)
+            store_quarter_stats(quarter, text)
+            if STATE_BACKEND != 'local':
+                # Snapshot pro uzly, které událost nezachytí (spuštěné později)
+                state_store.set_snapshot(f'quarter:{quarter}', text)
+                state_store.publish(NODE_ID, 'quarter', {'quarter': quarter, 'stats': text})
+            logger.info(f"Statistiky čtvrtletí {quarter} uloženy do archivu")
+        quarter = next_quarter(quarter)
+
+def refresh_live_quarter():
+    """Přepočítá statistiky běžícího čtvrtletí a zveřejní je ostatním uzlům (jen na vedoucím uzlu)"""
+    quarter = current_vote_quarter()
+    stats = calculate_quarter_statistics(quarter)
+    live_quarter_cache.update(quarter=quarter, version=osm_stats_cache['last_updated'], data=stats)
+    publish_shared('live_quarter', stats)
+    return stats
+
+def live_quarter_statistics(quarter):
+    """Statistiky běžícího čtvrtletí, nebo None, pokud ještě nejsou k dispozici.
+    
+    Vedoucí uzel je přepočítá jen po nové synchronizaci s OSM API. Ostatní uzly mají
+    changesety jen ze startu, vracejí proto verzi zveřejněnou vedoucím uzlem.
+    """
+    if is_leader() and (live_quarter_cache['data'] is None or live_quarter_cache['quarter'] != quarter or
+                        live_quarter_cache['version'] != osm_stats_cache['last_updated']):
+        refresh_live_quarter()
+    if live_quarter_cache['quarter'] != quarter:
+        return None
+    return live_quarter_cache['data']
+
+# Periodické úlohy - každá úloha má vlastní interval, jitter, timeout a backoff při chybě
+class Job:
+    """Periodická úloha běžící ve vlastní smyčce na pozadí.
+    
+    Pomalá nebo zaseknutá úloha neblokuje ostatní; po překročení timeoutu se počítá
+    jako selhání a další běh začne až po jejím doběhnutí. Po selhání se interval
+    exponenciálně prodlužuje až do max_backoff.
+    """
+    
+    def __init__(self, name, func, interval, jitter=0.1, timeout=None, max_backoff=None, leader_only=True):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.timeout = timeout or interval
+        self.max_backoff = max_backoff or interval * 16
+        self.leader_only = leader_only
+        self.running = False
+        self.last_run = None
+        self.last_duration = None
+        self.last_error = None
+        self.failures = 0
+        # Jednorázové profilování příštího běhu (viz /api/admin/profile/<job>)
+        self.profile_next = False
+    
+    def next_delay(self):
+        """Interval do dalšího běhu včetně backoffu a náhodného rozptylu"""
+        delay = min(self.interval * (2 ** self.failures), self.max_backoff)
+        return max(0.0, delay * (1 + random.uniform(-self.jitter, self.jitter)))
+    
+    def _execute(self, finished):
+        started = time.monotonic()
+        self.last_run = datetime.now()
         try:
-            # Aktualizace statistik každých 5 minut
-            update_osm_stats()
-            
-            # Ukládání dat každých 30 sekund
-            save_data()
-            
-            # Kontrola konce čtvrtletí
-            check_quarter_end()
-            
+            if self.profile_next or self.name in PROFILE_JOBS:
+                _, profiled = profile_call('job', self.name, self.func)
+                if profiled:
+                    self.profile_next = False
+                elif self.profile_next:
+                    # Vyžádaný profil se nezahazuje, zkusí se při příštím běhu
+                    logger.warning(f"Profil úlohy {self.name} přeskočen, běží jiný profil")
+            else:
+                self.func()
+            self.last_error = None
         except Exception as e:
-            logger.error(f"Chyba v periodických úlohách: {e}")
-        
-        time.sleep(30)
+            self.last_error = str(e)
+            logger.error(f"Chyba v úloze {self.name}: {e}")
+        finally:
+            self.last_duration = time.monotonic() - started
+            self.running = False
+            finished.set()
+    
+    def run_once(self):
+        """Spustí úlohu a počká nejvýše timeout; vrací True při úspěchu"""
+        if self.running:
+            logger.warning(f"Úloha {self.name} stále běží, přeskakuji")
+            return False
+        self.running = True
+        finished = threading.Event()
+        socketio.start_background_task(self._execute, finished)
+        if not finished.wait(self.timeout):
+            self.last_error = f"timeout po {self.timeout} s"
+            logger.error(f"Úloha {self.name} překročila timeout {self.timeout} s")
+            return False
+        return self.last_error is None
+    
+    def loop(self):
+        while True:
+            # Při více procesech běží úlohy jen na vedoucím uzlu
+            if self.leader_only and not is_leader():
+                socketio.sleep(self.interval)
+                continue
+            if self.run_once():
+                self.failures = 0
+            else:
+                self.failures += 1
+            socketio.sleep(self.next_delay())
+
+def run_stats_refresh():
+    """Aktualizace statistik - chyba OSM API se počítá jako selhání kvůli backoffu"""
+    refresh_osm_stats()
+    if osm_stats_cache['last_error']:
+        raise RuntimeError(osm_stats_cache['last_error'])
 
 def check_quarter_end():
     """Kontrola, zda nekončí čtvrtletí"""
     global current_project
     
+    # Skončená čtvrtletí se uloží do archivu statistik
+    freeze_finished_quarters()
+    
     now = datetime.now()
     
     # Pokud je 2.4.2026 00:00, vyhlásit vítěze pro Q2
@@ -599,8 +3034,11 @@ def check_quarter_end():
                 winning_idea = max(available_ideas, key=lambda x: x.get('votes', 0))
                 
                 # Označit jako vítězný
-                for idea in project_ideas:
-                    idea['winning'] = (idea['id'] == winning_idea['id'])
+                with data_lock:
+                    for idea in project_ideas:
+                        idea['winning'] = (idea['id'] == winning_idea['id'])
+                    idea_listing.touch()
+                    record_event('winner', {'idea_id': winning_idea['id']})
                 
                 current_project = {
                     'id': winning_idea['id'],
@@ -619,46 +3057,664 @@ def check_quarter_end():
                     'text': f'🎉 Vyhlášen vítězný projekt pro letní čtvrtletí 2026: "{winning_idea["title"]}"! Mapování probíhá od 2.4. do 1.7.2026.',
                     'timestamp': now.isoformat()
                 }
-                chat_messages.append(system_message)
+                with data_lock:
+                    append_chat_message(system_message)
+                    record_event('chat', system_message)
                 socketio.emit('chat_message', system_message)
                 logger.info(f"Vyhlášen vítězný projekt pro Q2: {winning_idea['title']}")
 
+jobs = [
+    Job('osm_stats', run_stats_refresh, interval=int(os.environ.get('STATS_REFRESH_SECONDS', 300)),
+        timeout=240, max_backoff=3600),
+    Job('save_data', save_data, interval=30),
+    Job('quarter_end', check_quarter_end, interval=60),
+]
+
+def start_jobs():
+    """Spustí smyčky všech periodických úloh"""
+    for job in jobs:
+        socketio.start_background_task(job.loop)
+
+# Sdružování broadcastů - změny hlasů a počtu uživatelů se rozesílají jedním rámcem za tick
+BROADCAST_TICK = float(os.environ.get('BROADCAST_TICK_SECONDS', 1.0))  # 0 = odeslat hned
+
+pending_broadcast = {
+    'votes': {},        # id nápadu -> poslední počet hlasů
+    'user_count': None  # poslední počet připojených uživatelů
+}
+broadcast_lock = threading.Lock()
+
+def flush_broadcasts():
+    """Odešle nahromaděné změny jako jeden rámec 'state_delta'"""
+    with broadcast_lock:
+        votes = pending_broadcast['votes']
+        user_count = pending_broadcast['user_count']
+        pending_broadcast['votes'] = {}
+        pending_broadcast['user_count'] = None
+    
+    if not votes and user_count is None:
+        return
+    
+    delta = {}
+    if votes:
+        delta['votes'] = votes
+    if user_count is not None:
+        delta['user_count'] = user_count
+    socketio.emit('state_delta', delta)
+
+def queue_vote_update(idea_id, votes):
+    """Zařadí nový počet hlasů nápadu do příštího rámce"""
+    with broadcast_lock:
+        pending_broadcast['votes'][idea_id] = votes
+    if BROADCAST_TICK <= 0:
+        flush_broadcasts()
+
+def queue_user_count(count):
+    """Zařadí nový počet připojených uživatelů do příštího rámce"""
+    with broadcast_lock:
+        pending_broadcast['user_count'] = count
+    if BROADCAST_TICK <= 0:
+        flush_broadcasts()
+
+def broadcast_loop():
+    """Periodicky rozesílá nahromaděné změny"""
+    while True:
+        socketio.sleep(BROADCAST_TICK)
+        try:
+            flush_broadcasts()
+        except Exception as e:
+            logger.error(f"Chyba při rozesílání změn: {e}")
+
+# Škálování na více procesů - sdílené úložiště stavu a volba jednoho vedoucího uzlu
+STATE_BACKEND = os.environ.get('STATE_BACKEND', 'local')  # 'local' (jeden proces) nebo 'redis'
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+NODE_ID = os.environ.get('NODE_ID') or f"{socket.gethostname()}-{os.getpid()}"
+CLUSTER_SYNC_INTERVAL = float(os.environ.get('CLUSTER_SYNC_SECONDS', 1.0))
+CLUSTER_HEARTBEAT = timedelta(seconds=5)
+LEADER_TTL = timedelta(seconds=15)
+CLUSTER_EVENTS_MAXLEN = 10000
+
+class LocalStateStore:
+    """Sdílené úložiště stavu v rámci jednoho procesu.
+    
+    Výchozí backend pro provoz s jedním procesem. Uzly sdílející jednu instanci
+    (v jednom procesu) se chovají stejně jako uzly sdílející Redis.
+    """
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.votes = {}                 # (čtvrtletí, user_id) -> set(id nápadů)
+        self.events = deque(maxlen=CLUSTER_EVENTS_MAXLEN)
+        self.next_event_id = 1
+        self.connections = {}           # uzel -> (počet spojení, čas hlášení)
+        self.leader = None              # (uzel, platnost do)
+        self.snapshots = {}             # název -> poslední zveřejněná data
+    
+    def seed_votes(self, votes):
+        with self.lock:
+            for quarter, quarter_votes in votes.items():
+                for user_id, idea_ids in quarter_votes.items():
+                    self.votes.setdefault((quarter, user_id), set()).update(idea_ids)
+    
+    def try_record_vote(self, quarter, user_id, idea_id, limit):
+        """Atomicky zapíše hlas; vrací None, 'duplicate' nebo 'limit'"""
+        with self.lock:
+            voted = self.votes.setdefault((quarter, user_id), set())
+            if idea_id in voted:
+                return 'duplicate'
+            if len(voted) >= limit:
+                return 'limit'
+            voted.add(idea_id)
+            return None
+    
+    def publish(self, node_id, op, payload):
+        with self.lock:
+            self.events.append((self.next_event_id, node_id, op, payload))
+            self.next_event_id += 1
+    
+    def latest_event_id(self):
+        with self.lock:
+            return self.next_event_id - 1
+    
+    def set_snapshot(self, name, payload):
+        """Uloží poslední verzi dat, která vedoucí uzel počítá za ostatní (heatmapa apod.)"""
+        with self.lock:
+            self.snapshots[name] = payload
+    
+    def get_snapshot(self, name):
+        with self.lock:
+            return self.snapshots.get(name)
+    
+    def read_events(self, after_id):
+        """Vrátí události s id větším než after_id jako [(id, uzel, operace, data)]"""
+        with self.lock:
+            return [event for event in self.events if event[0] > after_id]
+    
+    def report_connections(self, node_id, count):
+        with self.lock:
+            self.connections[node_id] = (count, datetime.now())
+    
+    def node_connections(self):
+        """Vrátí {uzel: počet spojení} pro uzly, které se nedávno ozvaly"""
+        deadline = datetime.now() - 3 * CLUSTER_HEARTBEAT
+        with self.lock:
+            return {node: count for node, (count, seen) in self.connections.items() if seen >= deadline}
+    
+    def try_acquire_leadership(self, node_id):
+        """Získá nebo prodlouží vedení; vrací True, pokud je uzel vedoucí"""
+        now = datetime.now()
+        with self.lock:
+            if self.leader is None or self.leader[0] == node_id or self.leader[1] < now:
+                self.leader = (node_id, now + LEADER_TTL)
+                return True
+            return False
+
+class RedisStateStore:
+    """Sdílené úložiště stavu v Redisu pro provoz více procesů nebo serverů"""
+    
+    VOTE_SCRIPT = """
+        if redis.call('SISMEMBER', KEYS[1], ARGV[1]) == 1 then return 1 end
+        if redis.call('SCARD', KEYS[1]) >= tonumber(ARGV[2]) then return 2 end
+        redis.call('SADD', KEYS[1], ARGV[1])
+        return 0
+    """
+    LEADER_SCRIPT = """
+        if redis.call('SET', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then return 1 end
+        if redis.call('GET', KEYS[1]) == ARGV[1] then
+            redis.call('PEXPIRE', KEYS[1], ARGV[2])
+            return 1
+        end
+        return 0
+    """
+    
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("STATE_BACKEND=redis vyžaduje balíček redis (pip install redis)")
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+        self.vote_script = self.redis.register_script(self.VOTE_SCRIPT)
+        self.leader_script = self.redis.register_script(self.LEADER_SCRIPT)
+    
+    def seed_votes(self, votes):
+        pipe = self.redis.pipeline(transaction=False)
+        for quarter, quarter_votes in votes.items():
+            for user_id, idea_ids in quarter_votes.items():
+                if idea_ids:
+                    pipe.sadd(f'osm:votes:{quarter}:{user_id}', *idea_ids)
+        pipe.execute()
+    
+    def try_record_vote(self, quarter, user_id, idea_id, limit):
+        result = self.vote_script(keys=[f'osm:votes:{quarter}:{user_id}'], args=[idea_id, limit])
+        return {0: None, 1: 'duplicate', 2: 'limit'}[int(result)]
+    
+    def publish(self, node_id, op, payload):
+        self.redis.xadd(
+            'osm:events',
+            {'node': node_id, 'op': op, 'data': json.dumps(payload, ensure_ascii=False)},
+            maxlen=CLUSTER_EVENTS_MAXLEN, approximate=True
+        )
+    
+    def latest_event_id(self):
+        entries = self.redis.xrevrange('osm:events', count=1)
+        return entries[0][0] if entries else '0-0'
+    
+    def set_snapshot(self, name, payload):
+        self.redis.set(f'osm:snapshot:{name}', json.dumps(payload, ensure_ascii=False))
+    
+    def get_snapshot(self, name):
+        value = self.redis.get(f'osm:snapshot:{name}')
+        return json.loads(value) if value is not None else None
+    
+    def read_events(self, after_id):
+        response = self.redis.xread({'osm:events': after_id}, count=500)
+        if not response:
+            return []
+        return [
+            (event_id, fields['node'], fields['op'], json.loads(fields['data']))
+            for event_id, fields in response[0][1]
+        ]
+    
+    def report_connections(self, node_id, count):
+        self.redis.hset('osm:connections', node_id, f"{count}|{time.time()}")
+    
+    def node_connections(self):
+        deadline = time.time() - 3 * CLUSTER_HEARTBEAT.total_seconds()
+        result = {}
+        for node, value in self.redis.hgetall('osm:connections').items():
+            count, seen = value.split('|')
+            if float(seen) >= deadline:
+                result[node] = int(count)
+        return result
+    
+    def try_acquire_leadership(self, node_id):
+        return bool(self.leader_script(keys=['osm:leader'], args=[node_id, int(LEADER_TTL.total_seconds() * 1000)]))
+
+state_store = RedisStateStore(REDIS_URL) if STATE_BACKEND == 'redis' else LocalStateStore()
+
+cluster_state = {
+    'leader': STATE_BACKEND == 'local',  # s jedním procesem je uzel vedoucí vždy
+    'last_event_id': None,               # poslední zpracovaná událost z ostatních uzlů
+    'remote_users': 0,                   # spojení na ostatních uzlech
+    'last_heartbeat': None
+}
+
+def is_leader():
+    """Jen vedoucí uzel stahuje z OSM API, ukládá data a kontroluje konec čtvrtletí"""
+    return cluster_state['leader']
+
+def record_event(op, payload):
+    """Zaznamená změnu - do žurnálu na vedoucím uzlu a ostatním uzlům přes úložiště (volat se zámkem data_lock)"""
+    if is_leader():
+        journal_append(op, payload)
+    if STATE_BACKEND != 'local':
+        state_store.publish(NODE_ID, op, payload)
+
+def cluster_user_count():
+    """Počet připojených uživatelů na všech uzlech"""
+    return connected_users + cluster_state['remote_users']
+
+def init_cluster():
+    """Začne sledovat změny z ostatních uzlů od aktuálního konce proudu událostí.
+    
+    Data, která počítá jen vedoucí uzel, se převezmou z posledních zveřejněných verzí;
+    další verze přijdou proudem událostí.
+    """
+    cluster_state['last_event_id'] = state_store.latest_event_id()
+    if STATE_BACKEND != 'local':
+        heatmap = state_store.get_snapshot('heatmap')
+        if heatmap is not None:
+            heatmap_cache['data'] = heatmap
+            heatmap_cache['window_start'] = stats_aggregator_window_start()
+        live_quarter = state_store.get_snapshot('live_quarter')
+        if live_quarter is not None:
+            live_quarter_cache.update(quarter=live_quarter['quarter'], version=None, data=live_quarter)
+
+def publish_shared(op, payload):
+    """Zveřejní data počítaná vedoucím uzlem - událostí pro běžící uzly a snapshotem pro nově spuštěné"""
+    if STATE_BACKEND != 'local':
+        state_store.set_snapshot(op, payload)
+        state_store.publish(NODE_ID, op, payload)
+
+def apply_cluster_event(op, payload):
+    """Zapracuje změnu z jiného uzlu do lokálního stavu"""
+    if op == 'stats':
+        refresh_stats_cache(payload)
+        return
+    if op == 'heatmap':
+        heatmap_cache['data'] = payload
+        heatmap_cache['window_start'] = stats_aggregator_window_start()
+        return
+    if op == 'quarter':
+        store_quarter_stats(payload['quarter'], payload['stats'])
+        return
+    if op == 'live_quarter':
+        live_quarter_cache.update(quarter=payload['quarter'], version=None, data=payload)
+        return
+    with data_lock:
+        apply_journal_entry({'op': op, 'data': payload})
+        if is_leader():
+            journal_append(op, payload)
+
+def take_over_leadership():
+    """Převezme práci vedoucího uzlu po předchozím.
+    
+    Uzel má stav stahování, agregátor a sloupce changesetů ze startu; changesety, které
+    mezitím do sdílené databáze uložil předchozí vedoucí uzel, by už nikdy nezapočítal.
+    Vedoucím se uzel stane až po načtení, do té doby úlohy vedoucího uzlu nespouští.
+    """
+    load_harvest_state()
+    init_stats_aggregator()
+    init_changeset_columns()
+    load_quarter_archive()
+    heatmap_cache['window_start'] = None
+    live_quarter_cache['version'] = None
+    with data_lock:
+        resume_journal()
+        cluster_state['leader'] = True
+    trigger_stats_refresh()
+
+def sync_cluster():
+    """Jedno kolo synchronizace: vedení, hlášení spojení a změny z ostatních uzlů"""
+    now = datetime.now()
+    if cluster_state['last_heartbeat'] is None or now - cluster_state['last_heartbeat'] >= CLUSTER_HEARTBEAT:
+        was_leader = cluster_state['leader']
+        leader = state_store.try_acquire_leadership(NODE_ID)
+        if leader and not was_leader and cluster_state['last_heartbeat'] is not None:
+            # Při prvním kole je stav načtený právě při startu
+            take_over_leadership()
+        with data_lock:
+            cluster_state['leader'] = leader
+        if leader != was_leader:
+            logger.info(f"Uzel {NODE_ID} {'je nyní vedoucí' if leader else 'už není vedoucí'}")
+        
+        state_store.report_connections(NODE_ID, connected_users)
+        remote_users = sum(count for node, count in state_store.node_connections().items() if node != NODE_ID)
+        if remote_users != cluster_state['remote_users']:
+            cluster_state['remote_users'] = remote_users
+            queue_user_count(cluster_user_count())
+        cluster_state['last_heartbeat'] = now
+    
+    for event_id, node_id, op, payload in state_store.read_events(cluster_state['last_event_id']):
+        cluster_state['last_event_id'] = event_id
+        if node_id != NODE_ID:
+            apply_cluster_event(op, payload)
+
+def cluster_loop():
+    """Synchronizace s ostatními uzly na pozadí"""
+    while True:
+        try:
+            sync_cluster()
+        except Exception as e:
+            logger.error(f"Chyba při synchronizaci uzlů: {e}")
+        socketio.sleep(CLUSTER_SYNC_INTERVAL)
+
+# Metriky stavu - počítají se až při čtení /metrics
+def stats_cache_age():
+    last_updated = osm_stats_cache['last_updated']
+    return round((datetime.now() - last_updated).total_seconds(), 1) if last_updated else None
+
+def job_metric(field):
+    return lambda: {(job.name,): getattr(job, field) for job in jobs}
+
+Gauge('sockets_connected', 'Připojené sockety tohoto procesu', collect=lambda: connected_users)
+Gauge('users_connected', 'Připojení uživatelé napříč uzly', collect=cluster_user_count)
+Gauge('leader', 'Zda je tento uzel vedoucí (1/0)', collect=lambda: int(is_leader()))
+Gauge('ideas', 'Počet nápadů v paměti', collect=lambda: len(project_ideas))
+Gauge('chat_buffer_messages', 'Počet zpráv v kruhovém bufferu chatu', collect=lambda: len(chat_messages))
+Gauge('voters', 'Počet hlasujících uživatelů podle čtvrtletí', labels=('quarter',),
+      collect=lambda: {(quarter,): len(voters) for quarter, voters in user_votes.items()})
+Gauge('journal_pending_entries', 'Záznamy žurnálu čekající na kompakci', collect=lambda: journal_state['entries'])
+Gauge('stats_cache_age_seconds', 'Stáří statistik v cache', collect=stats_cache_age)
+Gauge('job_last_duration_seconds', 'Doba posledního běhu periodické úlohy', labels=('job',),
+      collect=job_metric('last_duration'))
+Gauge('job_failures', 'Počet po sobě jdoucích selhání periodické úlohy', labels=('job',),
+      collect=job_metric('failures'))
+Gauge('job_last_run_timestamp_seconds', 'Čas posledního spuštění periodické úlohy', labels=('job',),
+      collect=lambda: {(job.name,): job.last_run.timestamp() for job in jobs if job.last_run})
+
+# Statické soubory - otisk obsahu v názvu, předkomprimované varianty a cache v paměti
+STATIC_DIR = os.path.dirname(os.path.abspath(__file__))
+# Jen tyto soubory se servírují; data a zdrojové kódy aplikace zůstávají neveřejné
+STATIC_ASSETS = ('script.js', 'style.css')
+STATIC_INDEX = 'index.html'
+STATIC_EXPORT_DIR = os.environ.get('STATIC_EXPORT_DIR')  # zápis variant pro reverzní proxy (gzip_static apod.)
+STATIC_IMMUTABLE = 'public, max-age=31536000, immutable'
+STATIC_REVALIDATE = 'no-cache'
+static_assets = {}
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+def compress_variants(body):
+    """Vrátí varianty obsahu podle kódování; komprese se použije jen pokud soubor zmenší"""
+    variants = {'identity': body}
+    candidates = {'gzip': gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli:
+        candidates['br'] = brotli.compress(body, quality=11)
+    for encoding, compressed in candidates.items():
+        if len(compressed) < len(body):
+            variants[encoding] = compressed
+    return variants
+
+def register_asset(url_name, body, mimetype, cache_control):
+    digest = hashlib.sha256(body).hexdigest()[:12]
+    static_assets[url_name] = {
+        'variants': compress_variants(body),
+        'etag': digest,
+        'mimetype': mimetype,
+        'cache_control': cache_control,
+    }
+    return digest
+
+def fingerprinted_name(name, digest):
+    base, ext = os.path.splitext(name)
+    return f"{base}.{digest}{ext}"
+
+def build_static_assets():
+    """Načte statické soubory, vytvoří názvy s otiskem obsahu a předkomprimuje je.
+    
+    Soubory s otiskem (script.<hash>.js) se cachují natrvalo; index.html odkazuje na ně
+    a prohlížeč si ho pokaždé ověří přes ETag. Původní názvy zůstávají dostupné
+    s revalidací kvůli starým kopiím index.html.
+    """
+    static_assets.clear()
+    with open(os.path.join(STATIC_DIR, STATIC_INDEX), encoding='utf-8') as f:
+        html = f.read()
+    for name in STATIC_ASSETS:
+        with open(os.path.join(STATIC_DIR, name), 'rb') as f:
+            body = f.read()
+        mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        digest = register_asset(name, body, mimetype, STATIC_REVALIDATE)
+        hashed = fingerprinted_name(name, digest)
+        static_assets[hashed] = dict(static_assets[name], cache_control=STATIC_IMMUTABLE)
+        html = re.sub(rf'(src|href)="{re.escape(name)}"', rf'\1="{hashed}"', html)
+    register_asset(STATIC_INDEX, html.encode('utf-8'), 'text/html', STATIC_REVALIDATE)
+    logger.info(f"Statické soubory připraveny: {', '.join(sorted(static_assets))}")
+
+def export_static_assets(directory):
+    """Zapíše soubory s otiskem a jejich .gz/.br varianty pro servírování reverzní proxy"""
+    os.makedirs(directory, exist_ok=True)
+    suffixes = {'identity': '', 'gzip': '.gz', 'br': '.br'}
+    for name, asset in static_assets.items():
+        for encoding, body in asset['variants'].items():
+            write_file_atomic(os.path.join(directory, name + suffixes[encoding]), body)
+
+def choose_encoding(variants):
+    """Vybere nejlepší kódování podle Accept-Encoding klienta"""
+    accepted = request.accept_encodings
+    for encoding in ('br', 'gzip'):
+        if encoding in variants and accepted[encoding]:
+            return encoding
+    return 'identity'
+
+def serve_asset(name):
+    asset = static_assets.get(name)
+    if asset is None:
+        return jsonify({'error': 'Nenalezeno'}), 404
+    
+    encoding = choose_encoding(asset['variants'])
+    etag = asset['etag'] if encoding == 'identity' else f"{asset['etag']}-{encoding}"
+    headers = {'Cache-Control': asset['cache_control'], 'Vary': 'Accept-Encoding'}
+    
+    if request.if_none_match.contains(etag):
+        response = Response(status=304, headers=headers)
+    else:
+        response = Response(asset['variants'][encoding], mimetype=asset['mimetype'], headers=headers)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    return response
+
+build_static_assets()
+
 # Flask routes
 @app.route('/')
 def index():
     """Hlavní stránka aplikace"""
-    return send_from_directory('.', 'index.html')
+    return serve_asset(STATIC_INDEX)
 
 @app.route('/<path:path>')
 def static_files(path):
-    """Soubory statického obsahu"""
-    return send_from_directory('.', path)
+    """Soubory statického obsahu - jen ze seznamu STATIC_ASSETS"""
+    return serve_asset(path)
 
 @app.route('/api/stats')
 def get_stats():
-    """API endpoint pro získání statistik"""
-    # Zkontrolovat cache
-    if (osm_stats_cache['data'] and osm_stats_cache['expires_at'] and 
-        datetime.now() < osm_stats_cache['expires_at']):
-        return jsonify(osm_stats_cache['data'])
-    
-    # Jinak aktualizovat
-    stats = update_osm_stats()
-    if stats:
+    """API endpoint pro získání statistik
+    
+    Vždy hned vrací poslední známá data; pokud jsou zastaralá, spustí jejich
+    aktualizaci na pozadí (nejvýše jednu současně). S parametrem quarter=Q1-2026
+    vrací statistiky daného čtvrtletí - skončená z archivu, běžící z lokální databáze.
+    """
+    quarter = request.args.get('quarter')
+    if quarter is not None:
+        return get_quarter_stats(quarter)
+    
+    now = datetime.now()
+    cache_result = 'hit'
+    
+    if osm_stats_cache['data'] is None:
+        # Před první synchronizací vrátíme to, co je v lokální databázi
+        cache_result = 'miss'
+        try:
+            osm_stats_cache['data'] = current_statistics()
+        except Exception as e:
+            logger.error(f"Chyba při výpočtu statistik: {e}")
+            return jsonify(calculate_statistics([]))
+    
+    if osm_stats_cache['expires_at'] is None or now >= osm_stats_cache['expires_at']:
+        if cache_result == 'hit':
+            cache_result = 'stale'
+        trigger_stats_refresh()
+    
+    # Poslední synchronizace selhala - podle konfigurace servírujeme poslední dobrá data
+    last_updated = osm_stats_cache['last_updated']
+    if osm_stats_cache['last_error'] and (last_updated is None or now - last_updated > STATS_TTL):
+        too_old = STATS_MAX_STALE and (last_updated is None or (now - last_updated).total_seconds() > STATS_MAX_STALE)
+        if not STATS_SERVE_STALE or too_old:
+            STATS_REQUESTS.inc(result='unavailable')
+            return jsonify({'error': 'Statistiky nejsou dostupné, OSM API neodpovídá'}), 503
+    
+    STATS_REQUESTS.inc(result=cache_result)
+    return jsonify(osm_stats_cache['data'])
+
+def get_quarter_stats(quarter):
+    """Statistiky jednoho čtvrtletí pro /api/stats?quarter="""
+    if quarter_bounds(quarter) is None:
+        return jsonify({'error': 'Čtvrtletí musí být ve tvaru Q1-2026'}), 400
+    
+    if quarter not in quarter_archive and STATE_BACKEND != 'local':
+        # Čtvrtletí uložené vedoucím uzlem dřív, než se tento uzel připojil
+        text = state_store.get_snapshot(f'quarter:{quarter}')
+        if text is not None:
+            store_quarter_stats(quarter, text)
+    
+    if quarter in quarter_archive:
+        STATS_REQUESTS.inc(result='archive')
+        response = Response(quarter_archive[quarter], mimetype='application/json')
+        response.headers['Cache-Control'] = 'public, max-age=86400'
+        return response
+    
+    if quarter == current_vote_quarter():
+        stats = live_quarter_statistics(quarter)
+        if stats is None:
+            STATS_REQUESTS.inc(result='unavailable')
+            return jsonify({'error': 'Statistiky čtvrtletí zatím nejsou k dispozici'}), 503
+        STATS_REQUESTS.inc(result='live')
         return jsonify(stats)
-    else:
-        return jsonify(calculate_statistics([]))
+    
+    return jsonify({
+        'error': f'Statistiky čtvrtletí {quarter} nejsou k dispozici',
+        'available': sorted(quarter_archive, key=quarter_bounds) + [current_vote_quarter()]
+    }), 404
+
+@app.route('/api/heatmap')
+def get_heatmap():
+    """Mřížka aktivity projektu nad ČR za okno čtvrtletí.
+    
+    Počítá se jen po stažení nových changesetů nebo při posunu okna o den,
+    dotaz jen vrací hotovou mřížku. Ostatní uzly vracejí mřížku zveřejněnou vedoucím uzlem.
+    """
+    if is_leader():
+        if heatmap_cache['data'] is None or heatmap_cache['window_start'] != stats_aggregator_window_start():
+            refresh_heatmap()
+    elif heatmap_cache['data'] is None:
+        return jsonify({'error': 'Mapa aktivity zatím není k dispozici'}), 503
+    return jsonify(heatmap_cache['data'])
 
 @app.route('/api/ideas')
 def get_ideas():
-    """API endpoint pro získání nápadů"""
-    return jsonify(project_ideas)
+    """API endpoint pro získání nápadů po stránkách.
+    
+    Parametry: sort ('votes', 'date' nebo 'quarter'), limit a cursor (next_cursor z předchozí
+    stránky). Odpověď nese ETag podle verze výpisu; nezměněný výpis vrátí 304 bez serializace.
+    """
+    sort = request.args.get('sort', 'votes')
+    if sort not in IdeaListing.ORDERS:
+        return jsonify({'error': f"Neznámé řazení, možnosti: {', '.join(IdeaListing.ORDERS)}"}), 400
+    try:
+        limit = max(1, min(int(request.args.get('limit', IDEAS_PAGE_SIZE)), IDEAS_MAX_PAGE_SIZE))
+    except ValueError:
+        return jsonify({'error': 'Neplatný limit'}), 400
+    after = None
+    if request.args.get('cursor'):
+        after = decode_idea_cursor(request.args['cursor'])
+        if after is None:
+            return jsonify({'error': 'Neplatný kurzor'}), 400
+    
+    with data_lock:
+        # Stejná verze výpisu může mít různé stránky, ETag proto zahrnuje i parametry
+        etag = f"ideas-{idea_listing.epoch}-{idea_listing.version}-{sort}-{limit}-{request.args.get('cursor', '')}"
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            keys, has_more = idea_listing.page(sort, after, limit)
+            response = jsonify({
+                'ideas': [idea_index[-key[-1]] for key in keys],
+                'next_cursor': encode_idea_cursor(keys[-1]) if has_more else None,
+                'total': len(idea_index),
+                'version': idea_listing.version
+            })
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/api/search')
+def search():
+    """Vyhledávání v nápadech a zprávách chatu (bez ohledu na diakritiku, i podle začátku slov).
+    
+    Parametry: q (dotaz), type ('ideas' nebo 'chat', jinak obojí), limit (nejvýše SEARCH_MAX_RESULTS).
+    """
+    query = request.args.get('q', '').strip()
+    if not search_tokens(query):
+        return jsonify({'error': 'Chybějící dotaz'}), 400
+    kind = request.args.get('type')
+    try:
+        limit = max(1, min(int(request.args.get('limit', 20)), SEARCH_MAX_RESULTS))
+    except ValueError:
+        return jsonify({'error': 'Neplatný limit'}), 400
+    
+    with data_lock:
+        scores = search_index.search(query)
+        ideas = []
+        if kind != 'chat':
+            ideas = [idea_index[key[1]] for key in scores if key[0] == 'idea']
+            ideas.sort(key=lambda idea: (-scores[('idea', idea['id'])], -idea.get('votes', 0)))
+        messages = []
+        if kind != 'ideas':
+            first_seq = chat_messages[0]['seq'] if chat_messages else 0
+            seqs = sorted((key[1] for key in scores if key[0] == 'chat'),
+                          key=lambda seq: (-scores[('chat', seq)], -seq))
+            messages = [chat_messages[seq - first_seq] for seq in seqs[:limit]]
+        result = {'query': query, 'ideas': ideas[:limit], 'chat': messages}
+    return jsonify(result)
 
 @app.route('/api/current-project')
 def get_current_project():
     """API endpoint pro získání aktuálního projektu"""
     return jsonify(current_project)
 
+@app.route('/metrics')
+def metrics():
+    """Metriky ve formátu Prometheus"""
+    return Response(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/admin/profile/<job_name>', methods=['POST'])
+def profile_job(job_name):
+    """Naplánuje profilování příštího běhu periodické úlohy (vyžaduje X-Profile-Token)"""
+    if not PROFILE_TOKEN:
+        return jsonify({'error': 'Profilování není zapnuté'}), 404
+    if not has_profile_token():
+        return jsonify({'error': 'Neplatný token'}), 403
+    job = next((job for job in jobs if job.name == job_name), None)
+    if not job:
+        return jsonify({'error': 'Neznámá úloha', 'jobs': [job.name for job in jobs]}), 404
+    job.profile_next = True
+    return jsonify({'success': True, 'job': job.name})
+
 @app.route('/api/vote', methods=['POST'])
 def vote_for_idea():
     """API endpoint pro hlasování pro nápad"""
@@ -667,43 +3723,48 @@ def vote_for_idea():
         if not data:
             return jsonify({'error': 'Žádná data'}), 400
         
-        idea_id = data.get('idea_id')
+        idea_id = normalize_idea_id(data.get('idea_id'))
         user_id = data.get('user_id')
         
         if not idea_id or not user_id:
             return jsonify({'error': 'Chybějící idea_id nebo user_id'}), 400
         
-        # Najít nápad
-        idea = None
-        for i in project_ideas:
-            if str(i.get('id')) == str(idea_id):
-                idea = i
-                break
-        
-        if not idea:
-            return jsonify({'error': 'Nápad nebyl nalezen'}), 404
-        
-        # Kontrola, zda uživatel již hlasoval pro tento nápad
-        if user_id in user_votes and idea_id in user_votes[user_id]:
-            return jsonify({'error': 'Už jste hlasovali pro tento nápad'}), 400
-        
-        # Kontrola počtu hlasů (max 2 na čtvrtletí)
-        user_vote_count = len(user_votes.get(user_id, []))
-        if user_vote_count >= 2:
-            return jsonify({'error': 'Již jste použili všechny hlasy pro toto čtvrtletí'}), 400
+        retry_after = rate_limit('vote', user_id=str(user_id))
+        if retry_after is not None:
+            return rate_limited_response(retry_after)
         
-        # Přidat hlas
-        idea['votes'] = idea.get('votes', 0) + 1
-        
-        # Uložit hlas uživatele
-        if user_id not in user_votes:
-            user_votes[user_id] = []
-        user_votes[user_id].append(idea_id)
+        with data_lock:
+            # Najít nápad
+            idea = idea_index.get(idea_id)
+            if not idea:
+                return jsonify({'error': 'Nápad nebyl nalezen'}), 404
+            
+            # Kontrola duplicitního hlasu a počtu hlasů (max 2 na čtvrtletí) atomicky ve sdíleném úložišti
+            quarter = current_vote_quarter()
+            vote_error = state_store.try_record_vote(quarter, user_id, idea_id, VOTES_PER_QUARTER)
+            
+            if vote_error:
+                VOTES_TOTAL.inc(result=vote_error)
+            
+            if vote_error == 'duplicate':
+                return jsonify({'error': 'Už jste hlasovali pro tento nápad'}), 400
+            
+            if vote_error == 'limit':
+                return jsonify({'error': 'Již jste použili všechny hlasy pro toto čtvrtletí'}), 400
+            
+            # Přidat hlas a uložit hlas uživatele
+            idea['votes'] = idea.get('votes', 0) + 1
+            # Počet po tomto hlasu - po uvolnění zámku ho může změnit souběžný hlas
+            votes = idea['votes']
+            user_votes.setdefault(quarter, {}).setdefault(user_id, set()).add(idea_id)
+            idea_listing.update(idea)
+            record_event('vote', {'idea_id': idea_id, 'user_id': user_id, 'quarter': quarter})
+        VOTES_TOTAL.inc(result='ok')
         
         # Broadcast update
-        socketio.emit('vote_update', {'ideaId': idea_id, 'votes': idea['votes']})
+        queue_vote_update(idea_id, votes)
         
-        return jsonify({'success': True, 'votes': idea['votes']})
+        return jsonify({'success': True, 'votes': votes})
         
     except Exception as e:
         logger.error(f"Chyba při hlasování: {e}")
@@ -730,6 +3791,10 @@ def add_idea():
         if len(description) < 10:
             return jsonify({'error': 'Popis musí mít alespoň 10 znaků'}), 400
         
+        retry_after = rate_limit('idea')
+        if retry_after is not None:
+            return rate_limited_response(retry_after)
+        
         # Vytvořit nový nápad
         new_idea = {
             'id': int(time.time() * 1000),
@@ -741,7 +3806,16 @@ def add_idea():
             'winning': False
         }
         
-        project_ideas.append(new_idea)
+        with data_lock:
+            # Dva nápady ve stejné milisekundě nesmí dostat stejné id
+            while new_idea['id'] in idea_index:
+                new_idea['id'] += 1
+            project_ideas.append(new_idea)
+            idea_index[new_idea['id']] = new_idea
+            index_idea(new_idea)
+            idea_listing.update(new_idea)
+            record_event('idea', new_idea)
+        IDEAS_TOTAL.inc()
         
         # Broadcast via WebSocket
         socketio.emit('new_idea', new_idea)
@@ -754,32 +3828,35 @@ def add_idea():
 
 # Socket.IO events
 @socketio.on('connect')
-def handle_connect():
+@instrument_event
+def handle_connect(auth=None):
     """Zpracování připojení nového klienta"""
     global connected_users
     connected_users += 1
     
-    # Odeslat aktuální počet připojených uživatelů
-    emit('user_count', connected_users, broadcast=True)
+    # Novému klientovi poslat počet hned, ostatním v příštím sdruženém rámci
+    emit('user_count', cluster_user_count())
+    queue_user_count(cluster_user_count())
     
-    # Odeslat posledních 50 zpráv z chatu
-    for message in chat_messages[-50:]:
-        emit('chat_message', message)
+    # Odeslat posledních 50 zpráv z chatu jednou dávkou
+    emit('chat_history', chat_history_page())
     
     logger.info(f"Uživatel připojen. Celkem uživatelů: {connected_users}")
 
 @socketio.on('disconnect')
-def handle_disconnect():
+@instrument_event
+def handle_disconnect(reason=None):
     """Zpracování odpojení klienta"""
     global connected_users
     connected_users -= 1
     
-    # Odeslat aktualizovaný počet připojených uživatelů
-    emit('user_count', connected_users, broadcast=True)
+    # Aktualizovaný počet připojených uživatelů půjde v příštím sdruženém rámci
+    queue_user_count(cluster_user_count())
     
     logger.info(f"Uživatel odpojen. Celkem uživatelů: {connected_users}")
 
 @socketio.on('chat_message')
+@instrument_event
 def handle_chat_message(data):
     """Zpracování zprávy v chatu"""
     try:
@@ -792,6 +3869,12 @@ def handle_chat_message(data):
         if not user or not text:
             return
         
+        # Nad limit se zpráva neuloží ani nerozešle, odesílatel dostane jen upozornění
+        retry_after = rate_limit('chat', sid=request.sid)
+        if retry_after is not None:
+            emit('rate_limited', {'event': 'chat_message', 'retry_after': math.ceil(retry_after)})
+            return
+        
         # Přidat časovou značku
         message = {
             'user': user,
@@ -799,10 +3882,11 @@ def handle_chat_message(data):
             'timestamp': datetime.now().isoformat()
         }
         
-        # Uložit zprávu (maximálně 200)
-        chat_messages.append(message)
-        if len(chat_messages) > 200:
-            chat_messages.pop(0)
+        # Uložit zprávu (kruhový buffer drží posledních 200)
+        with data_lock:
+            append_chat_message(message)
+            record_event('chat', message)
+        CHAT_MESSAGES_TOTAL.inc()
         
         # Odeslat všem připojeným klientům
         emit('chat_message', message, broadcast=True, include_self=False)
@@ -810,22 +3894,54 @@ def handle_chat_message(data):
     except Exception as e:
         logger.error(f"Chyba při zpracování zprávy: {e}")
 
+@socketio.on('chat_history')
+@instrument_event
+def handle_chat_history(data):
+    """Odeslání starších zpráv chatu - klient posílá kurzor 'before' z předchozí dávky"""
+    try:
+        if not isinstance(data, dict) or data.get('before') is None:
+            return
+        page = chat_history_page(before=data['before'], limit=data.get('limit', CHAT_REPLAY_SIZE))
+        page['before'] = data['before']
+        emit('chat_history', page)
+    except (TypeError, ValueError) as e:
+        logger.warning(f"Neplatný požadavek na historii chatu: {e}")
+
 @socketio.on('vote_update')
+@instrument_event
 def handle_vote_update(data):
-    """Broadcast aktualizace hlasů"""
-    emit('vote_update', data, broadcast=True, include_self=False)
+    """Aktualizace hlasů od starších klientů - rozešle se počet ze serveru, ne z klienta"""
+    if not isinstance(data, dict):
+        return
+    idea = idea_index.get(normalize_idea_id(data.get('ideaId')))
+    if idea:
+        queue_vote_update(idea['id'], idea['votes'])
 
 # Hlavní funkce
 if __name__ == '__main__':
+    # Varianty statických souborů pro reverzní proxy
+    if STATIC_EXPORT_DIR:
+        export_static_assets(STATIC_EXPORT_DIR)
+    
     # Načtení existujících dat
     load_data()
+    load_harvest_state()
+    init_stats_aggregator()
+    init_changeset_columns()
+    load_quarter_archive()
+    init_cluster()
+    
+    # Spuštění periodických úloh (první aktualizace statistik proběhne hned)
+    start_jobs()
     
-    # Spuštění vlákna pro periodické úlohy
-    tasks_thread = threading.Thread(target=periodic_tasks, daemon=True)
-    tasks_thread.start()
+    # Sdružené rozesílání změn klientům
+    if BROADCAST_TICK > 0:
+        socketio.start_background_task(broadcast_loop)
     
-    # První aktualizace statistik
-    update_osm_stats()
+    # Synchronizace s ostatními uzly
+    if STATE_BACKEND != 'local':
+        sync_cluster()
+        socketio.start_background_task(cluster_loop)
     
     print("=" * 70)
     print("PRODUKČNÍ APLIKACE - Projekt čtvrtletí pro českou OSM komunitu")
@@ -834,16 +3950,18 @@ if __name__ == '__main__':
     print(f"Aktuální projekt (Q1 2026): {current_project['title']}")
     print(f"Období: {current_project['start_date']} - {current_project['end_date']}")
     print("=" * 70)
-    print("Aplikace běží na http://0.0.0.0:4040")
+    print(f"Aplikace běží na http://0.0.0.0:{os.environ.get('PORT', 4040)} (režim {ASYNC_MODE})")
     print("Ukončete stiskem Ctrl+C")
     print("=" * 70)
     
-    # Spuštění aplikace
+    # Spuštění aplikace - v režimu gevent/eventlet běží produkční WSGI server daného backendu,
+    # vývojový server Werkzeug jen v režimu threading
+    run_options = {'allow_unsafe_werkzeug': True} if ASYNC_MODE == 'threading' else {}
     socketio.run(
         app, 
         host='0.0.0.0', 
-        port=4040, 
+        port=int(os.environ.get('PORT', 4040)), 
         debug=False, 
-        allow_unsafe_werkzeug=True,
-        log_output=True
+        log_output=SOCKETIO_LOGGING,
+        **run_options
     )
\ No newline at end of file
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+Benchmark horkých cest aplikace - parsování changesetů, statistiky, hlasování a rozesílání
+
+Měří na syntetických (nebo nahraných) datech OSM API:
+    parse       parsování XML odpovědi (parse_changesets_stream, jako při stahování)
+    fetch       stažení a parsování jedné odpovědi z lokálního HTTP serveru (fetch_changesets_page)
+    stats       calculate_statistics nad seznamem changesetů (a s NumPy i calculate_statistics_columnar)
+    api         propustnost /api/vote a /api/idea přes testovacího klienta Flasku
+    fanout      připojení N klientů Socket.IO a rozeslání zprávy všem
+    replication zpracování minutových diffů replikace changesetů z lokálního adresáře
+
+Syntetická data se generují s pevným seedem, takže běhy jsou mezi verzemi srovnatelné.
+Výsledek se vypíše jako JSON (nebo uloží do --output) pro porovnání regresí.
+
+Příklad:
+    python bench/hot_paths.py --sizes 1000,10000,100000 --output bench-results.json
+    python bench/hot_paths.py --only parse,stats --xml nahrana_odpoved.xml
+    python bench/hot_paths.py --only replication --feed-dir /tmp/feed   # feed zůstane pro ruční testy
+
+Aplikace se spouští v dočasném adresáři, data projektu se nemění.
+"""
+
+import argparse
+import gzip
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import quoteattr
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS = ('parse', 'fetch', 'stats', 'api', 'fanout', 'replication')
+REPLICATION_DIFF_SIZE = 100  # changesetů v jednom diffu feedu
+
+
+def generate_changesets_xml(count, seed=42, hashtag_ratio=0.3, users=500, first_id=10_000_000, outside_ratio=0.0):
+    """Vygeneruje odpověď OSM API s count changesety za posledních 90 dní, od nejnovějších.
+    
+    Podíl outside_ratio changesetů leží mimo ČR (jako v celosvětové replikaci).
+    """
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    offsets = sorted((rng.randrange(90 * 24 * 3600) for _ in range(count)))
+    parts = ['<?xml version="1.0" encoding="UTF-8"?>\n<osm version="0.6" generator="bench">\n']
+    for i, offset in enumerate(offsets):
+        created = now - timedelta(seconds=offset)
+        closed = created + timedelta(minutes=rng.randrange(1, 60))
+        uid = rng.randrange(users)
+        if rng.random() < hashtag_ratio:
+            hashtags = '#projektctvrtleti;#osmcz'
+            comment = 'Doplnění adres #projektctvrtleti'
+        else:
+            hashtags = '#osmcz'
+            comment = 'Oprava cest'
+        lat = 48.55 + rng.random() * 2.5
+        lon = 12.09 + rng.random() * 6.7
+        if rng.random() < outside_ratio:
+            lon -= 60
+        parts.append(
+            f'<changeset id="{first_id + count - i}" created_at="{created:%Y-%m-%dT%H:%M:%SZ}" '
+            f'closed_at="{closed:%Y-%m-%dT%H:%M:%SZ}" open="false" user={quoteattr(f"mapper_{uid}")} '
+            f'uid="{uid}" min_lat="{lat:.7f}" min_lon="{lon:.7f}" max_lat="{lat + 0.01:.7f}" '
+            f'max_lon="{lon + 0.01:.7f}" comments_count="0" changes_count="{rng.randrange(1, 500)}">'
+            f'<tag k="comment" v={quoteattr(comment)}/><tag k="hashtags" v={quoteattr(hashtags)}/>'
+            f'<tag k="created_by" v="iD 2.30"/></changeset>\n'
+        )
+    parts.append('</osm>\n')
+    return ''.join(parts).encode('utf-8')
+
+
+def write_replication_feed(directory, count, seed=42, id_base=0):
+    """Zapíše do adresáře feed replikace changesetů (state.yaml a diffy AAA/BBB/CCC.osm.gz).
+    
+    Diffy mají po REPLICATION_DIFF_SIZE changesetech, polovina changesetů leží mimo ČR.
+    Changesety mají id id_base + 1 až id_base + count. Vrací počet diffů.
+    """
+    diffs = max(1, -(-count // REPLICATION_DIFF_SIZE))
+    for sequence in range(1, diffs + 1):
+        size = min(REPLICATION_DIFF_SIZE, count - (sequence - 1) * REPLICATION_DIFF_SIZE)
+        payload = generate_changesets_xml(size, seed + sequence, outside_ratio=0.5,
+                                          first_id=id_base + (sequence - 1) * REPLICATION_DIFF_SIZE)
+        digits = f"{sequence:09d}"
+        path = os.path.join(directory, digits[:3], digits[3:6], f"{digits[6:]}.osm.gz")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with gzip.open(path, 'wb') as f:
+            f.write(payload)
+    with open(os.path.join(directory, 'state.yaml'), 'w') as f:
+        f.write(f"---\nlast_run: {datetime.now(timezone.utc):%Y-%m-%d %H:%M:%S}.000000000 +00:00\nsequence: {diffs}\n")
+    return diffs
+
+
+def measure(func, repeat, setup=None):
+    """Spustí func repeat-krát a vrátí nejlepší a mediánový čas v sekundách.
+    
+    setup se volá před každým během a do času se nepočítá.
+    """
+    times = []
+    result = None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - started)
+    return {'best_s': round(min(times), 6), 'median_s': round(statistics.median(times), 6)}, result
+
+
+def record(results, name, size, timing, **extra):
+    entry = {'benchmark': name, 'size': size, **timing}
+    if size:
+        entry['per_item_us'] = round(timing['best_s'] / size * 1e6, 3)
+        entry['items_per_s'] = round(size / timing['best_s'], 1) if timing['best_s'] else None
+    entry.update(extra)
+    results.append(entry)
+    print(f"  {name:<8} {size:>8}  best {timing['best_s'] * 1000:9.2f} ms  "
+          f"median {timing['median_s'] * 1000:9.2f} ms", file=sys.stderr)
+
+
+def serve_xml(payload):
+    """Spustí lokální HTTP server, který na každý dotaz vrátí payload"""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/xml; charset=utf-8')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def bench_parsing(app, payloads, args, results):
+    for size, payload in payloads:
+        if 'parse' in args.only:
+            timing, page = measure(lambda: app.parse_changesets_stream(io.BytesIO(payload)), args.repeat)
+            record(results, 'parse', size, timing, matched=len(page['changesets']), xml_bytes=len(payload))
+
+        if 'fetch' in args.only:
+            server = serve_xml(payload)
+            app.OSM_API_URL = f"http://127.0.0.1:{server.server_address[1]}/api/0.6/changesets"
+            end = datetime.now(timezone.utc)
+            try:
+                timing, page = measure(lambda: app.fetch_changesets_page(end - timedelta(days=90), end), args.repeat)
+            finally:
+                server.shutdown()
+            record(results, 'fetch', size, timing, matched=len(page['changesets']) if page else None)
+
+        if 'stats' in args.only:
+            changesets = app.parse_changesets_stream(io.BytesIO(payload))['changesets']
+            timing, _ = measure(lambda: app.calculate_statistics(changesets), args.repeat)
+            record(results, 'stats', size, timing, changesets=len(changesets))
+
+            # Vektorový engine nad sloupci (jen s NumPy)
+            if app.np is not None:
+                app.changeset_columns = app.ChangesetColumns()
+                app.changeset_columns.append(changesets)
+                timing, _ = measure(app.calculate_statistics_columnar, args.repeat)
+                record(results, 'stats_np', size, timing, changesets=len(changesets))
+
+
+def bench_replication(app, args, results):
+    app.OSM_FETCH_MODE = 'replication'
+    app.OSM_REPLICATION_MAX_DIFFS = 10 ** 9
+    runs = iter(range(10 ** 9))
+    id_base = 0
+    for size in args.sizes:
+        directory = args.feed_dir or tempfile.mkdtemp(prefix='osm-feed-')
+        diffs = write_replication_feed(directory, size, args.seed, id_base)
+        id_base += size
+        app.OSM_REPLICATION_URL = directory
+        matched = []
+
+        def fresh_db():
+            # Každý běh do prázdné databáze od začátku feedu, jinak by se od druhého
+            # běhu měřilo jen přeskakování changesetů, které už v databázi jsou
+            with app.db_lock:
+                if app._db is not None:
+                    app._db.close()
+                    app._db = None
+                app.CHANGESET_DB = f"replication-{next(runs)}.sqlite3"
+                app.get_db()
+            app.harvest_state['replication_sequence'] = 0
+
+        def ingest():
+            matched.append(len(app.harvest_changesets()))
+
+        timing, _ = measure(ingest, args.repeat, setup=fresh_db)
+        record(results, 'replication', size, timing, diffs=diffs, new_changesets=matched[0])
+
+
+def bench_api(app, args, results):
+    client = app.app.test_client()
+    ideas = []
+    payload = {'title': 'Benchmark nápad', 'description': 'Nápad vytvořený benchmarkem', 'author': 'bench'}
+
+    def add_ideas():
+        for _ in range(args.requests):
+            response = client.post('/api/idea', json=payload)
+            ideas.append(response.get_json()['idea']['id'])
+
+    timing, _ = measure(add_ideas, 1)
+    record(results, 'idea', args.requests, timing)
+
+    # Každý uživatel má jen dva hlasy za čtvrtletí, proto každý požadavek hlasuje jiný uživatel
+    counter = iter(range(10 ** 9))
+
+    def vote():
+        for i in range(args.requests):
+            response = client.post('/api/vote', json={'idea_id': ideas[i % len(ideas)],
+                                                      'user_id': f"bench_{next(counter)}"})
+            assert response.status_code == 200, response.get_json()
+
+    timing, _ = measure(vote, args.repeat)
+    record(results, 'vote', args.requests, timing)
+
+
+def bench_fanout(app, args, results):
+    for count in args.clients:
+        clients = []
+
+        def connect():
+            for _ in range(count):
+                clients.append(app.socketio.test_client(app.app))
+
+        timing, _ = measure(connect, 1)
+        record(results, 'connect', count, timing)
+
+        message = {'votes': {str(i): i for i in range(20)}, 'user_count': count}
+
+        def broadcast():
+            for _ in range(args.broadcasts):
+                app.socketio.emit('state_delta', message)
+
+        timing, _ = measure(broadcast, args.repeat)
+        # Jedna položka = jedna zpráva doručená jednomu klientovi
+        deliveries = count * args.broadcasts
+        record(results, 'fanout', deliveries, timing, clients=count, broadcasts=args.broadcasts)
+
+        for client in clients:
+            client.disconnect()
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1000,10000,100000', help='počty syntetických changesetů')
+    parser.add_argument('--xml', help='nahraná odpověď OSM API místo syntetických dat')
+    parser.add_argument('--only', default=','.join(BENCHMARKS), help=f"vybrané benchmarky ({','.join(BENCHMARKS)})")
+    parser.add_argument('--repeat', type=int, default=5, help='počet opakování (bere se nejlepší)')
+    parser.add_argument('--requests', type=int, default=500, help='počet požadavků na /api/vote a /api/idea')
+    parser.add_argument('--clients', default='100,1000', help='počty klientů Socket.IO')
+    parser.add_argument('--broadcasts', type=int, default=20, help='počet rozeslaných zpráv')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--feed-dir', help='adresář pro feed replikace (jinak dočasný)')
+    parser.add_argument('--output', help='soubor pro výsledky JSON (jinak stdout)')
+    args = parser.parse_args()
+    args.only = set(args.only.split(','))
+    args.clients = [int(x) for x in args.clients.split(',') if x]
+
+    output = os.path.abspath(args.output) if args.output else None
+    xml_path = os.path.abspath(args.xml) if args.xml else None
+    args.sizes = [int(size) for size in args.sizes.split(',') if size]
+    args.feed_dir = os.path.abspath(args.feed_dir) if args.feed_dir else None
+
+    # Aplikace zapisuje data do pracovního adresáře - běží v dočasném
+    os.chdir(tempfile.mkdtemp(prefix='osm-bench-'))
+    sys.path.insert(0, REPO_DIR)
+    # Všechny požadavky benchmarku přicházejí z jedné adresy, omezení četnosti by je odmítlo
+    os.environ.setdefault('RATE_LIMITS', 'off')
+    import app
+    # Informační log o každém připojení by měření zkreslil
+    app.logger.setLevel('WARNING')
+
+    if xml_path:
+        with open(xml_path, 'rb') as f:
+            payload = f.read()
+        payloads = [(payload.count(b'<changeset '), payload)]
+    else:
+        payloads = [(size, generate_changesets_xml(size, args.seed)) for size in args.sizes]
+
+    results = []
+    bench_parsing(app, payloads, args, results)
+    if 'api' in args.only:
+        bench_api(app, args, results)
+    if 'fanout' in args.only:
+        bench_fanout(app, args, results)
+    if 'replication' in args.only:
+        bench_replication(app, args, results)
+
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'async_mode': app.ASYNC_MODE,
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'source': args.xml or 'synthetic',
+        },
+        'results': results,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if output:
+        with open(output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
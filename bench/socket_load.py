@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Zátěžový profil Socket.IO - kolik současných spojení udrží jeden proces serveru
+
+Postupně otevírá spojení na běžící server, drží je otevřená a průběžně měří, kolik
+jich je připojených a (s --pid) paměť serveru. Výsledek vypíše jako JSON.
+
+Příklad:
+    SOCKETIO_ASYNC_MODE=gevent python app.py &
+    python bench/socket_load.py --url http://localhost:4040 --clients 2000 --pid $!
+
+Vyžaduje python-socketio[asyncio_client] (aiohttp), volitelně psutil pro měření paměti.
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import socketio
+
+
+async def open_client(url, transport, stats):
+    """Otevře jedno spojení a drží ho, dokud ho neukončí hlavní smyčka"""
+    client = socketio.AsyncClient(reconnection=False)
+    started = time.perf_counter()
+    try:
+        await client.connect(url, transports=[transport], wait_timeout=30)
+    except Exception as e:
+        stats['failed'] += 1
+        stats['errors'][type(e).__name__] = stats['errors'].get(type(e).__name__, 0) + 1
+        return None
+    stats['connected'] += 1
+    stats['connect_times'].append(time.perf_counter() - started)
+    return client
+
+
+def server_rss(pid):
+    """Vrátí RSS procesu serveru v MB (nebo None bez psutil/--pid)"""
+    if not pid:
+        return None
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return round(psutil.Process(pid).memory_info().rss / 1024 / 1024, 1)
+
+
+async def run(args):
+    stats = {'connected': 0, 'failed': 0, 'errors': {}, 'connect_times': []}
+    clients = []
+    steps = []
+    started = time.perf_counter()
+
+    for offset in range(0, args.clients, args.batch):
+        batch = min(args.batch, args.clients - offset)
+        results = await asyncio.gather(*(open_client(args.url, args.transport, stats) for _ in range(batch)))
+        clients.extend(client for client in results if client)
+        steps.append({
+            'attempted': offset + batch,
+            'connected': sum(1 for client in clients if client.connected),
+            'server_rss_mb': server_rss(args.pid),
+            'elapsed_s': round(time.perf_counter() - started, 2),
+        })
+        if args.stop_on_failure and stats['failed']:
+            break
+
+    # Spojení podržet a pak zkontrolovat, kolik jich přežilo
+    await asyncio.sleep(args.hold)
+    held = sum(1 for client in clients if client.connected)
+
+    await asyncio.gather(*(client.disconnect() for client in clients), return_exceptions=True)
+
+    connect_times = sorted(stats['connect_times'])
+    return {
+        'url': args.url,
+        'transport': args.transport,
+        'clients_requested': args.clients,
+        'connected': stats['connected'],
+        'failed': stats['failed'],
+        'errors': stats['errors'],
+        'held_after_s': args.hold,
+        'held': held,
+        'connect_p50_ms': round(connect_times[len(connect_times) // 2] * 1000, 1) if connect_times else None,
+        'connect_p99_ms': round(connect_times[int(len(connect_times) * 0.99)] * 1000, 1) if connect_times else None,
+        'server_rss_mb': server_rss(args.pid),
+        'steps': steps,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:4040')
+    parser.add_argument('--clients', type=int, default=1000, help='počet spojení')
+    parser.add_argument('--batch', type=int, default=100, help='kolik spojení otevřít najednou')
+    parser.add_argument('--hold', type=float, default=10, help='jak dlouho spojení držet (s)')
+    parser.add_argument('--transport', default='websocket', choices=['websocket', 'polling'])
+    parser.add_argument('--pid', type=int, help='PID serveru pro měření paměti (psutil)')
+    parser.add_argument('--stop-on-failure', action='store_true', help='skončit po prvním neúspěšném spojení')
+    parser.add_argument('--output', help='soubor pro JSON výsledek (jinak stdout)')
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        sys.stdout.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -90,6 +90,7 @@ document.addEventListener('DOMContentLoaded', function() {
     
     const remainingVotesElement = document.getElementById('remainingVotes');
     const ideasContainer = document.getElementById('ideasContainer');
+    const loadMoreIdeasBtn = document.getElementById('loadMoreIdeasBtn');
     const addIdeaBtn = document.getElementById('addIdeaBtn');
     const ideaTitleInput = document.getElementById('ideaTitle');
     const ideaDescriptionInput = document.getElementById('ideaDescription');
@@ -117,16 +118,26 @@ document.addEventListener('DOMContentLoaded', function() {
         localStorage.setItem('osmProjectVotes', JSON.stringify(userVotes));
     }
     
-    // Načtení nápadů z backendu
+    // Načtení nápadů z backendu - po stránkách seřazených podle hlasů
     let ideas = [];
+    let ideasCursor = null;
     
-    function loadIdeas() {
-        ideasContainer.innerHTML = '<div class="loading"><i class="fas fa-spinner"></i> Načítám nápady...</div>';
+    function loadIdeas(more = false) {
+        if (!more) {
+            ideasContainer.innerHTML = '<div class="loading"><i class="fas fa-spinner"></i> Načítám nápady...</div>';
+        }
         
-        fetch('/api/ideas')
+        const url = more && ideasCursor ? `/api/ideas?sort=votes&cursor=${encodeURIComponent(ideasCursor)}` : '/api/ideas?sort=votes';
+        fetch(url)
             .then(response => response.json())
             .then(data => {
-                ideas = data;
+                const loaded = more ? ideas : [];
+                data.ideas.forEach(idea => {
+                    if (!loaded.some(i => i.id === idea.id)) loaded.push(idea);
+                });
+                ideas = loaded;
+                ideasCursor = data.next_cursor;
+                loadMoreIdeasBtn.hidden = !ideasCursor;
                 renderIdeas();
             })
             .catch(error => {
@@ -135,6 +146,8 @@ document.addEventListener('DOMContentLoaded', function() {
             });
     }
     
+    loadMoreIdeasBtn.addEventListener('click', () => loadIdeas(true));
+    
     // Aktualizace uživatelských hlasů v nápadcích
     function updateUserVotesInIdeas() {
         ideas.forEach(idea => {
@@ -153,10 +166,8 @@ document.addEventListener('DOMContentLoaded', function() {
         
         ideasContainer.innerHTML = '';
         
-        // Seřadit nápady podle počtu hlasů (sestupně)
-        const sortedIdeas = [...ideas].sort((a, b) => b.votes - a.votes);
-        
-        sortedIdeas.forEach(idea => {
+        // V pořadí ze serveru - stránky navazují podle kurzoru, přeřazení by je promíchalo
+        ideas.forEach(idea => {
             const ideaElement = document.createElement('div');
             ideaElement.className = `idea-item fade-in ${idea.winning ? 'winning' : ''}`;
             ideaElement.innerHTML = `
@@ -240,9 +251,6 @@ document.addEventListener('DOMContentLoaded', function() {
                 // Uložit a znovu vykreslit
                 updateRemainingVotes();
                 renderIdeas();
-                
-                // Oznámit přes socket
-                socket.emit('vote_update', { ideaId, votes: data.votes });
             } else {
                 alert('Chyba při hlasování: ' + (data.error || 'Neznámá chyba'));
             }
@@ -388,6 +396,52 @@ document.addEventListener('DOMContentLoaded', function() {
     }
     
     // Leaderboard
+    // Heatmapa aktivity - mřížka počtů changesetů nad ČR (řádky od severu)
+    const heatmapCanvas = document.getElementById('heatmapCanvas');
+    
+    function drawHeatmap(heatmap) {
+        if (!heatmap || !heatmap.cells) return;
+        
+        // Poměr stran podle zeměpisné šířky, aby ČR nebyla roztažená
+        const [west, south, east, north] = heatmap.bbox;
+        const aspect = (east - west) * Math.cos((south + north) / 2 * Math.PI / 180) / (north - south);
+        heatmapCanvas.width = 600;
+        heatmapCanvas.height = Math.round(600 / aspect);
+        
+        const ctx = heatmapCanvas.getContext('2d');
+        const cellWidth = heatmapCanvas.width / heatmap.columns;
+        const cellHeight = heatmapCanvas.height / heatmap.rows;
+        ctx.clearRect(0, 0, heatmapCanvas.width, heatmapCanvas.height);
+        
+        heatmap.cells.forEach((row, r) => {
+            row.forEach((value, c) => {
+                if (!value) return;
+                // Odmocnina zvýrazní i buňky s malou aktivitou
+                const intensity = Math.sqrt(value / heatmap.max);
+                ctx.fillStyle = `rgba(44, 120, 115, ${0.15 + 0.85 * intensity})`;
+                ctx.fillRect(c * cellWidth, r * cellHeight, Math.ceil(cellWidth), Math.ceil(cellHeight));
+            });
+        });
+    }
+    
+    // Otisk naposledy vykreslené mapy; stats_update nese otisk aktuální
+    let heatmapVersion = null;
+    
+    function loadHeatmap() {
+        fetch('/api/heatmap')
+            .then(response => {
+                if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                return response.json();
+            })
+            .then(heatmap => {
+                heatmapVersion = heatmap.version;
+                drawHeatmap(heatmap);
+            })
+            .catch(error => {
+                console.error('Chyba při načítání heatmapy:', error);
+            });
+    }
+    
     const leaderboardContainer = document.getElementById('leaderboardContainer');
     
     function renderLeaderboard(leaderboardData) {
@@ -401,13 +455,17 @@ document.addEventListener('DOMContentLoaded', function() {
         leaderboardData.forEach((item, index) => {
             const leaderboardItem = document.createElement('div');
             leaderboardItem.className = 'leaderboard-item fade-in';
+            // Při žebříčku podle objemu editací posílá server i počet editací
+            const score = item.edits !== undefined
+                ? `${item.edits} editací (${item.changesets} changesetů)`
+                : `${item.changesets} changesetů`;
             leaderboardItem.innerHTML = `
                 <div class="leaderboard-rank">${index + 1}</div>
                 <div class="leaderboard-user">
                     <i class="fas fa-user"></i>
                     ${escapeHtml(item.user)}
                 </div>
-                <div class="leaderboard-score">${item.changesets} changesetů</div>
+                <div class="leaderboard-score">${score}</div>
             `;
             leaderboardContainer.appendChild(leaderboardItem);
         });
@@ -416,7 +474,10 @@ document.addEventListener('DOMContentLoaded', function() {
     // Načtení statistik z backendu
     function loadStats() {
         fetch('/api/stats')
-            .then(response => response.json())
+            .then(response => {
+                if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                return response.json();
+            })
             .then(data => {
                 updateStatsDisplay(data);
                 initChart(data);
@@ -468,7 +529,7 @@ document.addEventListener('DOMContentLoaded', function() {
     });
     
     // Přidání zprávy do chatu
-    function addMessage(message, isOwn = false, isSystem = false) {
+    function addMessage(message, isOwn = false, isSystem = false, prepend = false) {
         const messageElement = document.createElement('div');
         const messageClass = isSystem ? 'system' : (isOwn ? 'own' : 'other');
         
@@ -489,10 +550,31 @@ document.addEventListener('DOMContentLoaded', function() {
             ${isSystem ? `<div class="message-time">${time}</div>` : ''}
         `;
         
+        if (prepend) {
+            // Starší zprávy vložit nahoru a zachovat pozici posuvníku
+            const previousHeight = messagesContainer.scrollHeight;
+            messagesContainer.insertBefore(messageElement, messagesContainer.firstChild);
+            messagesContainer.scrollTop += messagesContainer.scrollHeight - previousHeight;
+            return;
+        }
+        
         messagesContainer.appendChild(messageElement);
         messagesContainer.scrollTop = messagesContainer.scrollHeight;
     }
     
+    // Historie chatu - server posílá zprávy v dávkách s kurzorem pro starší zprávy
+    let oldestChatSeq = null;
+    let newestChatSeq = 0;
+    let hasOlderChat = false;
+    let loadingOlderChat = false;
+    
+    messagesContainer.addEventListener('scroll', function() {
+        if (messagesContainer.scrollTop === 0 && hasOlderChat && !loadingOlderChat) {
+            loadingOlderChat = true;
+            socket.emit('chat_history', { before: oldestChatSeq });
+        }
+    });
+    
     // Odeslání zprávy
     function sendMessage() {
         const text = messageInput.value.trim();
@@ -559,15 +641,56 @@ document.addEventListener('DOMContentLoaded', function() {
     socket.on('chat_message', function(message) {
         const currentUser = usernameInput.value.trim();
         const isOwn = message.user === currentUser;
+        if (message.seq) newestChatSeq = Math.max(newestChatSeq, message.seq);
         addMessage(message, isOwn, false);
     });
     
+    socket.on('rate_limited', function(data) {
+        addMessage({
+            user: 'Systém',
+            text: `Posíláte zprávy příliš rychle, zpráva nebyla odeslána. Zkuste to znovu za ${data.retry_after} s.`
+        }, false, true);
+    });
+    
+    socket.on('chat_history', function(page) {
+        const currentUser = usernameInput.value.trim();
+        
+        if (page.before !== undefined) {
+            // Starší zprávy na vyžádání - vkládají se nahoru od nejnovější
+            loadingOlderChat = false;
+            page.messages.slice().reverse().forEach(message => {
+                addMessage(message, message.user === currentUser, false, true);
+            });
+        } else {
+            // Dávka po připojení - po znovupřipojení přeskočit už zobrazené zprávy
+            page.messages.forEach(message => {
+                if (message.seq <= newestChatSeq) return;
+                newestChatSeq = message.seq;
+                addMessage(message, message.user === currentUser, false);
+            });
+        }
+        
+        if (page.before !== undefined || oldestChatSeq === null) {
+            oldestChatSeq = page.cursor;
+            hasOlderChat = page.has_more;
+        }
+    });
+    
     socket.on('new_idea', function(idea) {
         // Přidat nápad do seznamu (jen pokud tam ještě není)
         const existingIdea = ideas.find(i => i.id === idea.id);
         if (!existingIdea) {
-            ideas.push(idea);
-            renderIdeas();
+            // Zařadit jako server (sort=votes): před nápady se stejným nebo nižším počtem
+            // hlasů, nový nápad je mezi nimi nejnovější. Patří-li až za načtené stránky,
+            // přijde se stránkou, na kterou ho server zařadí.
+            const position = ideas.findIndex(i => i.votes <= idea.votes);
+            if (position !== -1) {
+                ideas.splice(position, 0, idea);
+                renderIdeas();
+            } else if (!ideasCursor) {
+                ideas.push(idea);
+                renderIdeas();
+            }
             
             // Zobrazit upozornění v chatu
             addMessage({
@@ -586,11 +709,33 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
     
+    // Sdružené změny ze serveru - hlasy a počet uživatelů v jednom rámci
+    socket.on('state_delta', function(delta) {
+        if (delta.votes) {
+            let changed = false;
+            Object.entries(delta.votes).forEach(([ideaId, votes]) => {
+                const idea = ideas.find(i => i.id == ideaId);
+                if (idea && idea.votes !== votes) {
+                    idea.votes = votes;
+                    changed = true;
+                }
+            });
+            if (changed) renderIdeas();
+        }
+        if (delta.user_count !== undefined) {
+            onlineCountElement.textContent = delta.user_count;
+        }
+    });
+    
     socket.on('stats_update', function(stats) {
         // Aktualizovat statistiky
         updateStatsDisplay(stats);
         initChart(stats);
         renderLeaderboard(stats.leaderboard);
+        // Mapu stahovat jen po její změně, ne při každém rozeslání statistik
+        if (stats.heatmap_version && stats.heatmap_version !== heatmapVersion) {
+            loadHeatmap();
+        }
     });
     
     // Zobrazení notifikace
@@ -655,5 +800,6 @@ document.addEventListener('DOMContentLoaded', function() {
     // Načtení inicializačních dat
     loadIdeas();
     loadStats();
+    loadHeatmap();
     updateRemainingVotes();
 });
\ No newline at end of file